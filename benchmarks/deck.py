@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Generates synthetic slide decks for the benchmarks.
+
+    $ python benchmarks/deck.py /tmp/deck --slides 500 --code-blocks 2
+    $ python benchmarks/deck.py /tmp/deck --format rst --images 10
+"""
+
+import os
+import sys
+import math
+import zlib
+import random
+import struct
+
+from optparse import OptionParser
+
+
+FORMATS = {
+    'md': {
+        'extension': '.md',
+        'separator': u'\n---\n\n',
+        'slide': u'# Slide {number}\n\n- First item\n- Second item\n\n'
+                 u'Lorem ipsum *dolor sit amet*, consectetur adipiscing elit.'
+                 u'\n',
+        'code': u'\n    !python\n'
+                u'    def multiply_{number}_{block}(x, y):\n'
+                u'        """Multiplies two numbers"""\n'
+                u'        return x * y + {block}\n',
+        'image': u'\n![image {image}](images/image{image}.png)\n',
+    },
+    'rst': {
+        'extension': '.rst',
+        'separator': u'\n----\n\n',
+        'slide': u'Slide {number}\n{underline}\n\n'
+                 u'- First item\n- Second item\n\n'
+                 u'Lorem ipsum *dolor sit amet*, consectetur adipiscing elit.'
+                 u'\n',
+        'code': u'\n.. sourcecode:: python\n\n'
+                u'    def multiply_{number}_{block}(x, y):\n'
+                u'        """Multiplies two numbers"""\n'
+                u'        return x * y + {block}\n',
+        'image': u'\n.. image:: images/image{image}.png\n',
+    },
+    'textile': {
+        'extension': '.textile',
+        'separator': u'\n---\n\n',
+        'slide': u'h1. Slide {number}\n\n* First item\n* Second item\n\n'
+                 u'Lorem ipsum _dolor sit amet_, consectetur adipiscing elit.'
+                 u'\n',
+        'code': u'\nbc. !python\n'
+                u'def multiply_{number}_{block}(x, y):\n'
+                u'    """Multiplies two numbers"""\n'
+                u'    return x * y + {block}\n',
+        'image': u'\n!images/image{image}.png!\n',
+    },
+}
+
+
+def write_png(path, size, rng):
+    """Writes a noisy RGB PNG image of about ``size`` bytes"""
+
+    side = max(1, int(math.sqrt(size / 3.0)))
+    rows = [b'\0' + rng.getrandbits(side * 24).to_bytes(side * 3, 'little')
+            for _ in range(side)]
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data \
+            + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(path, 'wb') as image_file:
+        image_file.write(b'\x89PNG\r\n\x1a\n')
+        image_file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', side, side,
+                                                    8, 2, 0, 0, 0)))
+        image_file.write(chunk(b'IDAT', zlib.compress(b''.join(rows))))
+        image_file.write(chunk(b'IEND', b''))
+
+
+def generate_deck(directory, slides=100, code_blocks=1, images=0,
+                  image_size=20000, format='md', files=1, seed=0):
+    """Writes a deck of ``slides`` slides split over ``files`` source files
+       into ``directory``. Each slide holds ``code_blocks`` Python code blocks
+       and one of the ``images`` images, which are reused round-robin once
+       every image was shown. Returns the source file paths.
+    """
+    if format not in FORMATS:
+        raise ValueError(u"Unsupported deck format %s" % format)
+    template = FORMATS[format]
+    rng = random.Random(seed)
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    if images:
+        images_dir = os.path.join(directory, 'images')
+        if not os.path.isdir(images_dir):
+            os.makedirs(images_dir)
+        for image in range(images):
+            write_png(os.path.join(images_dir, 'image%d.png' % image),
+                      image_size, rng)
+
+    files = max(1, min(files, slides))
+    sources = []
+    for index in range(files):
+        numbers = range(index * slides // files, (index + 1) * slides // files)
+        contents = []
+        for number in numbers:
+            title = u'Slide %d' % number
+            slide = template['slide'].format(number=number,
+                                             underline=u'=' * len(title))
+            for block in range(code_blocks):
+                slide += template['code'].format(number=number, block=block)
+            if images:
+                slide += template['image'].format(image=number % images)
+            contents.append(slide)
+
+        source = os.path.join(directory, 'slides-%03d%s'
+                              % (index, template['extension']))
+        with open(source, 'w') as source_file:
+            source_file.write(template['separator'].join(contents))
+        sources.append(source)
+
+    return sources
+
+
+def add_deck_options(parser):
+    """Adds the synthetic deck options to an ``OptionParser``"""
+
+    parser.add_option(
+        "--slides",
+        type="int",
+        dest="slides",
+        help="Number of slides (default: 100)",
+        default=100)
+
+    parser.add_option(
+        "--code-blocks",
+        type="int",
+        dest="code_blocks",
+        help="Number of code blocks per slide (default: 1)",
+        default=1)
+
+    parser.add_option(
+        "--images",
+        type="int",
+        dest="images",
+        help="Number of distinct images, shown round-robin (default: 0)",
+        default=0)
+
+    parser.add_option(
+        "--image-size",
+        type="int",
+        dest="image_size",
+        help="Approximate size of each image in bytes (default: 20000)",
+        metavar="BYTES",
+        default=20000)
+
+    parser.add_option(
+        "--format",
+        type="choice",
+        choices=sorted(FORMATS),
+        dest="format",
+        help="Source format: md, rst or textile (default: md)",
+        default='md')
+
+    parser.add_option(
+        "--files",
+        type="int",
+        dest="files",
+        help="Number of source files the slides are split over (default: 1)",
+        default=1)
+
+
+def deck_options(options):
+    """Returns the ``generate_deck`` arguments from parsed options"""
+
+    return dict((name, getattr(options, name)) for name in
+                ('slides', 'code_blocks', 'images', 'image_size', 'format',
+                 'files'))
+
+
+def main():
+    """Deck generator entry point"""
+
+    parser = OptionParser(usage="%prog [options] directory")
+    add_deck_options(parser)
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.print_help()
+        sys.exit(1)
+
+    for source in generate_deck(args[0], **deck_options(options)):
+        print(source)
+
+
+if __name__ == '__main__':
+    main()
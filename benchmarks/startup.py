@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Measures the startup time of the landslide command line, and fails when it
+exceeds its budget.
+
+    $ python benchmarks/startup.py
+    $ python benchmarks/startup.py --runs 20 --version-budget 0.1
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+from optparse import OptionParser
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse_options():
+    """Parses the benchmark command line options"""
+
+    parser = OptionParser(usage="%prog [options]")
+
+    parser.add_option(
+        "-n", "--runs",
+        type="int",
+        dest="runs",
+        help="Number of runs of each command (default: 10)",
+        default=10)
+
+    parser.add_option(
+        "--version-budget",
+        type="float",
+        dest="version_budget",
+        help="Budget in seconds of `landslide --version` (default: 0.15)",
+        metavar="SECONDS",
+        default=0.15)
+
+    parser.add_option(
+        "--build-budget",
+        type="float",
+        dest="build_budget",
+        help="Budget in seconds of a one-slide build (default: 0.6)",
+        metavar="SECONDS",
+        default=0.6)
+
+    return parser.parse_args()[0]
+
+
+def measure(args, runs, cwd):
+    """Returns the median wall time of running landslide with ``args``"""
+
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    command = [sys.executable, '-m', 'landslide.main'] + args
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call(command, cwd=cwd, env=env,
+                              stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    """Benchmark entry point"""
+
+    options = _parse_options()
+    work_dir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(work_dir, 'slides.md'), 'w') as slides:
+            slides.write('# Hello\n')
+
+        checks = [
+            ('--version', ['--version'], options.version_budget),
+            ('one-slide build', ['slides.md', '-q', '--no-cache'],
+             options.build_budget),
+        ]
+        failed = False
+        for name, args, budget in checks:
+            timing = measure(args, options.runs, work_dir)
+            status = 'ok' if timing <= budget else 'OVER BUDGET'
+            failed = failed or timing > budget
+            print('%-16s %7.3fs  budget %6.3fs  %s'
+                  % (name, timing, budget, status))
+    finally:
+        shutil.rmtree(work_dir)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Times each phase of a landslide build on a synthetic deck, and compares the
+results against a stored baseline.
+
+    $ python benchmarks/suite.py run --slides 500 --images 20 -o new.json
+    $ python benchmarks/suite.py compare baseline.json new.json
+
+The phase times are exclusive: the time spent in the ``parse`` phase isn't
+counted again in the ``fetch`` phase calling it, for instance.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+
+from optparse import OptionParser
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from deck import add_deck_options, deck_options, generate_deck  # noqa: E402
+
+from landslide import __version__  # noqa: E402
+from landslide import highlight, utils  # noqa: E402
+from landslide.generator import Generator  # noqa: E402
+from landslide.macro import DirectiveScanner  # noqa: E402
+
+
+class PhaseTimer(object):
+    """Accumulates the exclusive time spent in each phase of a build"""
+
+    def __init__(self):
+        self.totals = {}
+        self.stack = []
+
+    def call(self, phase, func, *args, **kwargs):
+        """Calls ``func``, counting its time minus the time of the nested
+           phases in ``phase``"""
+        self.stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            self.totals[phase] = self.totals.get(phase, 0.0) + elapsed - nested
+
+    def wrap(self, obj, name, phase):
+        """Times the calls of the ``name`` method of ``obj`` in ``phase``"""
+        func = getattr(obj, name)
+        setattr(obj, name,
+                lambda *args, **kwargs: self.call(phase, func, *args,
+                                                  **kwargs))
+
+
+def instrument(generator, timer):
+    """Times the build phases of a generator instance"""
+
+    timer.wrap(generator, 'fetch_contents', 'fetch')
+    timer.wrap(generator, 'parse', 'parse')
+    timer.wrap(generator, 'get_slide_vars', 'slide_vars')
+    timer.wrap(generator, 'embed_theme_images', 'embed')
+    timer.wrap(generator, 'share_images', 'embed')
+
+    for entry in generator.get_macro_pipeline():
+        if isinstance(entry, DirectiveScanner):
+            timer.wrap(entry, 'process', 'directive_scan')
+            for macro in entry.macros:
+                timer.wrap(macro, 'handle_directive',
+                           'macro:%s' % type(macro).__name__)
+        else:
+            timer.wrap(entry, 'process', 'macro:%s' % type(entry).__name__)
+
+
+def build(source, destination, embed, split_sources):
+    """Builds the deck once, returning the exclusive time of each phase"""
+
+    timer = PhaseTimer()
+    start = time.perf_counter()
+    generator = Generator(source, destination_file=destination, embed=embed,
+                          split_sources=split_sources, cache=False, jobs=1)
+    instrument(generator, timer)
+
+    # the html is rendered before it's written, so that the write phase
+    # only times writing it out the way the generator does
+    render_stream = generator.render_stream
+    generator.render_stream = lambda: timer.call(
+        'render', lambda: list(render_stream()))
+
+    # each build writes the whole file, rather than finding it unchanged
+    if os.path.exists(destination):
+        os.remove(destination)
+
+    timer.call('discovery', generator.find_sources, source)
+    timer.call('write', generator.write)
+
+    timer.totals['total'] = time.perf_counter() - start
+    return timer.totals
+
+
+def reset_caches():
+    """Empties the in-process caches, so that each run is a cold build"""
+
+    highlight._highlighted.clear()
+    utils._encoded_images.clear()
+
+
+def run(args):
+    """Runs the benchmark and writes its results as JSON"""
+
+    parser = OptionParser(usage="%prog run [options]")
+    add_deck_options(parser)
+
+    parser.add_option(
+        "-n", "--runs",
+        type="int",
+        dest="runs",
+        help="Number of builds, the median time is kept (default: 5)",
+        default=5)
+
+    parser.add_option(
+        "-i", "--embed",
+        action="store_true",
+        dest="embed",
+        help="Build standalone presentations with embedded images",
+        default=False)
+
+    parser.add_option(
+        "-s", "--split-sources",
+        action="store_true",
+        dest="split_sources",
+        help="Split sources into slides before parsing them",
+        default=False)
+
+    parser.add_option(
+        "--warm",
+        action="store_true",
+        dest="warm",
+        help="Keep the in-process caches between builds",
+        default=False)
+
+    parser.add_option(
+        "-o", "--output",
+        dest="output",
+        help="The JSON results file (default: stdout)",
+        metavar="FILE",
+        default=None)
+
+    (options, args) = parser.parse_args(args)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        deck_dir = os.path.join(work_dir, 'deck')
+        generate_deck(deck_dir, **deck_options(options))
+        destination = os.path.join(work_dir, 'presentation.html')
+
+        timings = {}
+        for _ in range(options.runs):
+            if not options.warm:
+                reset_caches()
+            totals = build(deck_dir, destination, options.embed,
+                           options.split_sources)
+            for phase, seconds in totals.items():
+                timings.setdefault(phase, []).append(seconds)
+        output_size = os.path.getsize(destination)
+    finally:
+        shutil.rmtree(work_dir)
+
+    results = {
+        'landslide': __version__,
+        'python': platform.python_version(),
+        'deck': deck_options(options),
+        'embed': options.embed,
+        'split_sources': options.split_sources,
+        'warm': options.warm,
+        'runs': options.runs,
+        'output_size': output_size,
+        'phases': dict((phase, sorted(values)[len(values) // 2])
+                       for phase, values in timings.items()),
+    }
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    return 0
+
+
+def compare(args):
+    """Compares benchmark results against a baseline, failing on regressions
+    """
+    parser = OptionParser(usage="%prog compare [options] baseline results")
+
+    parser.add_option(
+        "-t", "--threshold",
+        type="float",
+        dest="threshold",
+        help="Relative slowdown of a phase considered as a regression "
+             "(default: 0.2)",
+        default=0.2)
+
+    parser.add_option(
+        "--min-delta",
+        type="float",
+        dest="min_delta",
+        help="Slowdowns smaller than this many seconds are ignored "
+             "(default: 0.005)",
+        metavar="SECONDS",
+        default=0.005)
+
+    (options, args) = parser.parse_args(args)
+
+    if len(args) != 2:
+        parser.print_help()
+        return 1
+
+    with open(args[0]) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args[1]) as results_file:
+        results = json.load(results_file)
+
+    if baseline['deck'] != results['deck']:
+        sys.stderr.write("Warning: the results come from different decks\n")
+
+    regressions = 0
+    print('%-40s %10s %10s %8s' % ('phase', 'baseline', 'results', 'change'))
+    for phase in sorted(set(baseline['phases']) | set(results['phases'])):
+        old = baseline['phases'].get(phase)
+        new = results['phases'].get(phase)
+        if old is None or new is None:
+            print('%-40s %10s %10s' % (phase,
+                                       '-' if old is None else '%.4f' % old,
+                                       '-' if new is None else '%.4f' % new))
+            continue
+        change = (new - old) / old if old else 0.0
+        regressed = new - old > options.min_delta and \
+            change > options.threshold
+        regressions += regressed
+        print('%-40s %10.4f %10.4f %+7.1f%%%s'
+              % (phase, old, new, change * 100,
+                 '  REGRESSION' if regressed else ''))
+
+    return 1 if regressions else 0
+
+
+def main():
+    """Benchmark suite entry point"""
+
+    commands = {'run': run, 'compare': compare}
+
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        sys.stderr.write("Usage: %s run|compare [options]\n" % sys.argv[0])
+        sys.exit(1)
+
+    sys.exit(commands[sys.argv[1]](sys.argv[2:]))
+
+
+if __name__ == '__main__':
+    main()
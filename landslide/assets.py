@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import os
+import codecs
+import hashlib
+
+from . import utils
+
+# Hex digits of the content hash in bundled file names
+HASH_LENGTH = 12
+
+# Prefix of the files listing the bundled files each presentation links to
+MANIFEST_PREFIX = '.landslide-'
+
+
+class AssetRegistry(object):
+    """ Keeps the contents of theme and user assets in memory, reading an
+        asset again only once its modification time or size changed.
+    """
+    def __init__(self):
+        self.assets = {}
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path, encoding='utf8'):
+        """ Returns the contents of the asset file at ``path``, along with
+            whether they were served from memory.
+        """
+        key = (os.path.abspath(path), encoding)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        cached = self.assets.get(key)
+        if cached and cached[0] == signature:
+            self.hits += 1
+            return cached[1], True
+
+        with codecs.open(path, encoding=encoding) as asset_file:
+            contents = asset_file.read()
+        self.assets[key] = (signature, contents)
+        self.misses += 1
+        return contents, False
+
+
+# Assets shared by all the generators of the process
+registry = AssetRegistry()
+
+
+class AssetBundle(object):
+    """ Copies assets to a directory under names holding a hash of their
+        contents, so that a static host can have them cached forever, and
+        links to them relatively to the presentation directory. Each file is
+        copied once, however often it is referenced. The files a build no
+        longer links to are removed by ``prune``.
+    """
+    def __init__(self, directory, base_dir):
+        self.directory = os.path.abspath(directory)
+        self.base_dir = os.path.abspath(base_dir)
+        self.files = {}
+        self.used = set()
+
+    def add(self, name, contents):
+        """ Stores ``contents`` bytes in the bundle under ``name``, followed
+            by their hash, and returns the bundled file name.
+        """
+        stem, extension = os.path.splitext(name)
+        digest = hashlib.sha1(contents).hexdigest()[:HASH_LENGTH]
+        bundled_name = u"%s.%s%s" % (stem, digest, extension)
+
+        path = os.path.join(self.directory, bundled_name)
+        if not os.path.exists(path):
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            utils.write_if_changed(path, [contents])
+        self.used.add(bundled_name)
+        return bundled_name
+
+    def add_file(self, path):
+        """ Stores the file at ``path`` in the bundle and returns the bundled
+            file name. Files are read again only once they changed.
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        cached = self.files.get(key)
+        if cached and cached[0] == signature:
+            self.used.add(cached[1])
+            return cached[1]
+
+        with open(path, 'rb') as asset_file:
+            bundled_name = self.add(os.path.basename(path), asset_file.read())
+        self.files[key] = (signature, bundled_name)
+        return bundled_name
+
+    def url(self, bundled_name):
+        """ Returns the url of a bundled file, relative to the presentation.
+        """
+        path = os.path.join(self.directory, bundled_name)
+        return os.path.relpath(path, self.base_dir).replace(os.sep, '/')
+
+    def use(self, html):
+        """ Marks the bundled files ``html`` links to as used by the current
+            build, for the slides bundled by an earlier build or another
+            process.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name not in self.used and self.url(name) in html:
+                self.used.add(name)
+
+    def prune(self, destination):
+        """ Removes the bundled files that the presentation written to
+            ``destination`` linked to in its previous build and no longer
+            uses, unless another presentation sharing the directory links to
+            them. Starts a new build.
+        """
+        digest = hashlib.sha1(os.path.abspath(destination).encode('utf_8'))
+        manifest = MANIFEST_PREFIX + digest.hexdigest()[:HASH_LENGTH]
+
+        previous, shared = set(), set()
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.startswith(MANIFEST_PREFIX):
+                    with codecs.open(os.path.join(self.directory, name),
+                                     encoding='utf_8') as manifest_file:
+                        names = set(manifest_file.read().splitlines())
+                    if name == manifest:
+                        previous = names
+                    else:
+                        shared |= names
+
+        for name in previous - self.used - shared:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+        if self.used or previous:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            utils.write_if_changed(
+                os.path.join(self.directory, manifest),
+                [u''.join(u"%s\n" % name
+                          for name in sorted(self.used)).encode('utf_8')])
+        self.used = set()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import configparser
+
+
+def build_deck(config_file, options):
+    """ Builds the presentation of a configuration file, returning a result
+        dict with its ``status`` (``ok`` or ``error``), build ``time``,
+        ``destination`` and ``error`` message.
+    """
+    from landslide.generator import Generator
+
+    result = {'config': config_file, 'status': 'ok', 'destination': None,
+              'error': None}
+    start = time.perf_counter()
+    try:
+        generator = Generator(config_file, **options)
+        result['destination'] = generator.destination_file
+        generator.execute()
+    except Exception as e:
+        if options.get('debug'):
+            raise
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['time'] = time.perf_counter() - start
+    return result
+
+
+def get_destination(config_file):
+    """ Returns the absolute destination path of a configuration file, or
+        ``None`` if it can't be read.
+    """
+    from landslide.generator import Generator
+
+    config = configparser.RawConfigParser()
+    try:
+        config.read(config_file)
+        if config.has_option('landslide', 'destination'):
+            destination = config.get('landslide', 'destination')
+        else:
+            destination = Generator.DEFAULT_DESTINATION
+    except configparser.Error:
+        return None
+    return os.path.abspath(destination)
+
+
+def build_decks(config_files, jobs=1, **options):
+    """ Builds the presentations of several configuration files, in this
+        process or in a pool of ``jobs`` processes. Each process builds its
+        decks one after the other, so the theme, template, highlighting and
+        image caches are shared by the decks it builds. Decks sharing their
+        destination with another deck aren't built and get an error result.
+        Returns the result of each deck, in the order of ``config_files``.
+    """
+    for config_file in config_files:
+        if not config_file.endswith('.cfg'):
+            raise IOError(u"Batch builds take configuration files, and %s "
+                          "isn't one" % config_file)
+    for option in ('watch', 'serve', 'direct', 'profile'):
+        if options.get(option):
+            raise RuntimeError(u"The %s option isn't available for batch "
+                               "builds" % option)
+
+    # decks writing the same file would overwrite each other
+    destinations = [get_destination(config_file)
+                    for config_file in config_files]
+    results = [None] * len(config_files)
+    for index, destination in enumerate(destinations):
+        others = [config_file for other_index, config_file
+                  in enumerate(config_files) if other_index != index and
+                  destination and destinations[other_index] == destination]
+        if others:
+            results[index] = {
+                'config': config_files[index], 'status': 'error',
+                'destination': destination, 'time': 0.0,
+                'error': u"Destination %s is also written by %s"
+                         % (destination, u", ".join(others))}
+    indexes = [index for index, result in enumerate(results)
+               if result is None]
+
+    # decks are parsed serially, as they are built in parallel
+    options['jobs'] = 1
+    jobs = min(jobs or os.cpu_count() or 1, len(indexes))
+
+    if jobs < 2:
+        for index in indexes:
+            results[index] = build_deck(config_files[index], options)
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(build_deck, config_files[index], options)
+                   for index in indexes]
+        for index, future in zip(indexes, futures):
+            results[index] = future.result()
+    return results
+
+
+def format_summary(results, elapsed=None):
+    """ Returns the lines of a summary table of batch build ``results``.
+    """
+    width = max([len(u'deck')] + [len(result['config'])
+                                  for result in results])
+    lines = [u'%-*s  %-6s  %8s  %s' % (width, u'deck', u'status', u'seconds',
+                                       u'output')]
+    for result in results:
+        lines.append(u'%-*s  %-6s  %8.3f  %s' % (
+            width, result['config'], result['status'], result['time'],
+            result['error'] or result['destination']))
+
+    failed = len([result for result in results if result['status'] != 'ok'])
+    total = u'%d decks, %d failed' % (len(results), failed)
+    if elapsed is not None:
+        total += u' in %.3fs' % elapsed
+    lines.append(total)
+    return lines
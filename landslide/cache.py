@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import tempfile
+
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+def get_cache_dir():
+    """ Returns the directory where landslide keeps its persistent caches,
+        honouring ``LANDSLIDE_CACHE_DIR`` and ``XDG_CACHE_HOME``.
+    """
+    if os.environ.get('LANDSLIDE_CACHE_DIR'):
+        return os.environ['LANDSLIDE_CACHE_DIR']
+    base_dir = (os.environ.get('XDG_CACHE_HOME')
+                or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base_dir, 'landslide')
+
+
+def hash_key(*parts):
+    """ Computes a stable cache key from strings or bytes ``parts``.
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode('utf_8')
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class FileCache(object):
+    """ A content-addressed cache storing one entry per file in a directory.
+
+        Entries are written to a temporary file then renamed in place, so
+        several processes can share the same directory safely. Reads touch
+        the entry modification time, which is used to evict least recently
+        used entries once the directory grows over ``max_size`` bytes.
+    """
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None
+
+    def path(self, key):
+        """ Returns the file path of the entry stored under ``key``.
+        """
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """ Returns the text stored under ``key``, or ``None``.
+        """
+        value = self.get_bytes(key)
+        return value.decode('utf_8') if value is not None else None
+
+    def set(self, key, value):
+        """ Stores ``value`` text under ``key``.
+        """
+        self.set_bytes(key, value.encode('utf_8'))
+
+    def get_bytes(self, key):
+        """ Returns the raw bytes stored under ``key``, or ``None``.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as entry:
+                value = entry.read()
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        return value
+
+    def set_bytes(self, key, value):
+        """ Stores ``value`` bytes under ``key``; failures are ignored as a
+            cache miss is always an acceptable outcome.
+        """
+        path = self.path(key)
+        tmp_path = None
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            try:
+                previous_size = os.path.getsize(path)
+            except OSError:
+                previous_size = 0
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                            prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as entry:
+                entry.write(value)
+            os.replace(tmp_path, path)
+        except (IOError, OSError):
+            # temporary files are left out of the entries, and never evicted
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+        if self._size is not None:
+            self._size += len(value) - previous_size
+        if self._size is None or self._size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        """ Returns ``(mtime, size, path)`` tuples for all stored entries.
+        """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if name.startswith('.tmp-'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """ Removes least recently used entries until the cache fits in
+            ``max_size`` bytes.
+        """
+        entries = self.entries()
+        self._size = sum(size for _, size, _ in entries)
+        if self._size <= self.max_size:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        """ Removes every entry of this cache.
+        """
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._size = 0
@@ -2,9 +2,12 @@
 
 import os
 import re
+import sys
+import json
 import codecs
 import inspect
-import jinja2
+import mimetypes
+import pickle
 import shutil
 import tempfile
 import configparser
@@ -12,14 +15,74 @@ import configparser
 from subprocess import Popen
 
 from . import utils
+from . import __version__
+from . import assets as assets_module
+from . import cache as cache_module
+from . import highlight as highlight_module
 from . import macro as macro_module
+from . import minify as minify_module
+from . import tracing
 from .parser import Parser
+from .scheduler import BuildCancelled
 
 
 BASE_DIR = os.path.dirname(__file__)
 THEMES_DIR = os.path.join(BASE_DIR, 'themes')
 TOC_MAX_LEVEL = 2
-VALID_LINENOS = ('no', 'inline', 'table')
+SPLIT_OUTPUT_MODES = ('slide', 'source')
+VALID_LINENOS = highlight_module.VALID_LINENOS
+THEME_IMAGE_RE = re.compile(
+    r'url\(\s*(?P<quote>["\']?)(?P<url>[^)"\']*?\.(?:jpe?g|gif|png|svg))'
+    r'(?P=quote)\s*\)', re.UNICODE)
+EMBEDDED_IMAGE_RE = re.compile(
+    r'(?P<tag><img\s(?:[^>]*?\s)?)src="(?P<url>data:[^"]+)"', re.UNICODE)
+SPLIT_FRAGMENT_RE = re.compile(r'^(slide|source)-\d+\.js$')
+
+# Jinja2 environments by template directory, encoding and bytecode cache
+_environments = {}
+# Undeclared variables of the last loaded version of each template
+_template_variables = {}
+
+
+def get_environment(template_dir, encoding='utf8', bytecode_cache_dir=None):
+    """ Returns the shared Jinja2 environment loading templates from a theme
+        directory, falling back to the default theme ones. Templates are
+        reloaded when their file changes, and their compiled code is kept in
+        ``bytecode_cache_dir`` if given.
+    """
+    key = (template_dir, encoding, bytecode_cache_dir)
+    if key not in _environments:
+        import jinja2
+
+        search_path = [template_dir]
+        default_dir = os.path.join(THEMES_DIR, 'default')
+        if os.path.abspath(template_dir) != os.path.abspath(default_dir):
+            search_path.append(default_dir)
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            if not os.path.isdir(bytecode_cache_dir):
+                os.makedirs(bytecode_cache_dir)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+        _environments[key] = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(search_path, encoding=encoding),
+            auto_reload=True, bytecode_cache=bytecode_cache)
+    return _environments[key]
+
+
+def get_template_variables(template):
+    """ Returns the names of the variables a template uses from its context.
+    """
+    cached = _template_variables.get(template.filename)
+    if not cached or cached[0] is not template:
+        import jinja2.meta
+
+        environment = template.environment
+        source = environment.loader.get_source(environment, template.name)[0]
+        variables = jinja2.meta.find_undeclared_variables(
+            environment.parse(source))
+        cached = _template_variables[template.filename] = (template,
+                                                           variables)
+    return cached[1]
 
 
 class Generator(object):
@@ -36,28 +99,60 @@ class Generator(object):
         macro_module.NotesMacro,
         macro_module.QRMacro,
     ]
-    user_css = []
-    user_js = []
 
     def __init__(self, source, **kwargs):
         """ Configures this generator. Available ``args`` are:
             - ``source``: source file or directory path
             Available ``kwargs`` are:
+            - ``assets_dir``: directory the images, stylesheets and scripts
+                              are copied to under content-hashed names,
+                              instead of being linked or embedded
+            - ``cache``: enables the persistent parse and highlighting caches
+            - ``cache_dir``: directory holding the persistent caches
+            - ``clear_cache``: empties the persistent caches before building
             - ``copy_theme``: copy theme directory and files into presentation
                               one
             - ``destination_file``: path to html or PDF destination file
             - ``direct``: enables direct rendering presentation to stdout
+            - ``debounce``: seconds to wait for changes to settle before
+                            rebuilding in watch mode
             - ``debug``: enables debug mode
             - ``embed``: generates a standalone document, with embedded assets
             - ``encoding``: the encoding to use for this presentation
             - ``extensions``: Comma separated list of markdown extensions
+            - ``image_max_size``: ``WIDTHxHEIGHT`` size embedded images are
+                                  downscaled to fit in, and recompressed
+            - ``image_quality``: quality of the recompressed JPEG and WebP
+                                 images, defaults to 85
+            - ``jobs``: number of processes parsing source files, defaults to
+                        1, parsing them in this process
+            - ``lazy_images``: moves every embedded image to the image table,
+                               so that the theme decodes images only as
+                               their slides are shown
             - ``logger``: a logger lambda to use for logging
+            - ``minify``: minifies the embedded or bundled stylesheets and
+                          scripts, and collapses the html whitespace
+            - ``port``: port of the preview server, defaults to 8000
             - ``presenter_notes``: enable presenter notes
+            - ``profile``: path of a Chrome trace event file recording the
+                           build timeline
             - ``relative``: enable relative asset urls
+            - ``serve``: serves the presentation from memory on localhost,
+                         reloading it in the browser when sources change
+            - ``split_output``: writes the slides to fragment files, one per
+                                ``slide`` or per ``source`` file, which the
+                                presentation loads on demand
+            - ``split_sources``: splits the sources into slides before parsing
+                                 them, so each slide is parsed and cached
+                                 on its own
             - ``theme``: path to the theme to use for this presentation
             - ``verbose``: enables verbose output
         """
+        self.assets_dir = kwargs.get('assets_dir', None)
+        self.cache = kwargs.get('cache', True)
+        self.cache_dir = kwargs.get('cache_dir') or cache_module.get_cache_dir()
         self.copy_theme = kwargs.get('copy_theme', False)
+        self.debounce = kwargs.get('debounce', 0.2)
         self.debug = kwargs.get('debug', False)
         self.destination_file = kwargs.get('destination_file',
                                            'presentation.html')
@@ -65,19 +160,65 @@ class Generator(object):
         self.embed = kwargs.get('embed', False)
         self.encoding = kwargs.get('encoding', 'utf8')
         self.extensions = kwargs.get('extensions', None)
+        self.image_max_size = kwargs.get('image_max_size', None)
+        self.image_quality = kwargs.get('image_quality', 85)
+        self.jobs = kwargs.get('jobs') or 1
+        self.lazy_images = kwargs.get('lazy_images', False)
         self.logger = kwargs.get('logger', None)
+        self.minify = kwargs.get('minify', False)
+        self.port = kwargs.get('port', 8000)
         self.presenter_notes = kwargs.get('presenter_notes', True)
+        self.profile = kwargs.get('profile', None)
+        if self.profile:
+            self.tracer = tracing.Tracer()
+        else:
+            self.tracer = tracing.NullTracer()
         self.relative = kwargs.get('relative', False)
+        self.serve = kwargs.get('serve', False)
+        self.split_output = kwargs.get('split_output', None)
+        self.split_sources = kwargs.get('split_sources', False)
         self.theme = kwargs.get('theme', 'default')
         self.verbose = kwargs.get('verbose', False)
         self.linenos = self.linenos_check(kwargs.get('linenos'))
         self.watch = kwargs.get('watch', False)
+        self.user_css = []
+        self.user_js = []
         self.math_output = kwargs.get('math_output', False)
         self.num_slides = 0
         self.__toc = []
+        self.source_slides = {}
+        self.prefetched = set()
+        self.is_cancelled = None
+
+        self.parse_cache = cache_module.FileCache(
+            os.path.join(self.cache_dir, 'parse'))
+        self.highlight_cache = cache_module.FileCache(
+            os.path.join(self.cache_dir, 'highlight'))
+        self.image_cache = cache_module.FileCache(
+            os.path.join(self.cache_dir, 'images'))
+        self.minify_cache = cache_module.FileCache(
+            os.path.join(self.cache_dir, 'minify'))
+        if kwargs.get('clear_cache', False):
+            self.parse_cache.clear()
+            self.highlight_cache.clear()
+            self.image_cache.clear()
+            self.minify_cache.clear()
+        if not self.cache:
+            self.parse_cache = self.highlight_cache = self.image_cache = None
+            self.minify_cache = None
+        # minified assets by content hash, for rebuilds of this process
+        self.minified_assets = {}
+
+        self.image_processor = None
+        if self.image_max_size:
+            from .images import ImageProcessor
+
+            self.image_processor = ImageProcessor(
+                self.image_max_size, self.image_quality, self.image_cache)
 
         # macros registering
         self.macros = []
+        self.macro_pipeline = None
         self.register_macro(*self.default_macros)
 
         if self.direct:
@@ -89,13 +230,15 @@ class Generator(object):
                           % source)
 
         if source.endswith('.cfg'):
-            config = self.parse_config(source)
+            with self.tracer.span('parse_config', source=source):
+                config = self.parse_config(source)
             self.source = config.get('source')
             if not self.source:
                 raise IOError('unable to fetch a valid source from config')
             source_abspath = os.path.abspath(self.source[0])
             self.destination_file = config.get('destination',
                 self.DEFAULT_DESTINATION)
+            self.assets_dir = config.get('assets_dir', self.assets_dir)
             self.embed = config.get('embed', False)
             self.relative = config.get('relative', False)
             self.copy_theme = config.get('copy_theme', False)
@@ -128,9 +271,36 @@ class Generator(object):
                            "Please use one of these file extensions in the "
                            "destination")
 
+        if self.split_output and self.split_output not in SPLIT_OUTPUT_MODES:
+            raise ValueError(u"Unknown split output mode %s, use one of %s"
+                             % (self.split_output,
+                                u", ".join(SPLIT_OUTPUT_MODES)))
+
+        if self.serve:
+            # served presentations don't link to local files
+            self.embed = True
+
+        self.bundle = None
+        if self.assets_dir:
+            if self.embed:
+                raise IOError(u"Assets can't be both embedded and copied to "
+                              "an assets directory")
+            self.bundle = assets_module.AssetBundle(
+                self.assets_dir,
+                os.path.dirname(os.path.abspath(self.destination_file)))
+
         self.theme_dir = self.find_theme_dir(self.theme, self.copy_theme)
         self.template_file = self.get_template_file()
 
+    def __getstate__(self):
+        """ Leaves build state out when shipping this generator to parsing
+            processes, which build their own macro pipeline.
+        """
+        state = self.__dict__.copy()
+        state.update({'source_slides': {}, 'prefetched': set(),
+                      'is_cancelled': None, 'macro_pipeline': None})
+        return state
+
     def add_user_css(self, css_list):
         """ Adds supplementary user css files to the presentation. The
             ``css_list`` arg can be either a ``list`` or a string.
@@ -139,15 +309,14 @@ class Generator(object):
             css_list = [css_list]
 
         for css_path in css_list:
-            if css_path and css_path not in self.user_css:
+            if css_path and not self.has_user_asset(self.user_css, css_path):
                 if not os.path.exists(css_path):
                     raise IOError('%s user css file not found' % (css_path,))
-                with codecs.open(css_path, encoding=self.encoding) as css_file:
-                    self.user_css.append({
-                        'path_url': utils.get_path_url(css_path,
-                                                       self.relative),
-                        'contents': css_file.read(),
-                    })
+                self.user_css.append({
+                    'path': css_path,
+                    'path_url': utils.get_path_url(css_path, self.relative),
+                    'contents': self.read_asset(css_path),
+                })
 
     def add_user_js(self, js_list):
         """ Adds supplementary user javascript files to the presentation. The
@@ -156,7 +325,7 @@ class Generator(object):
         if isinstance(js_list, str):
             js_list = [js_list]
         for js_path in js_list:
-            if js_path and js_path not in self.user_js:
+            if js_path and not self.has_user_asset(self.user_js, js_path):
                 if js_path.startswith("http:"):
                     self.user_js.append({
                         'path_url': js_path,
@@ -165,13 +334,12 @@ class Generator(object):
                 elif not os.path.exists(js_path):
                     raise IOError('%s user js file not found' % (js_path,))
                 else:
-                    with codecs.open(js_path,
-                                     encoding=self.encoding) as js_file:
-                        self.user_js.append({
-                            'path_url': utils.get_path_url(js_path,
-                                                           self.relative),
-                            'contents': js_file.read(),
-                        })
+                    self.user_js.append({
+                        'path': js_path,
+                        'path_url': utils.get_path_url(js_path,
+                                                       self.relative),
+                        'contents': self.read_asset(js_path),
+                    })
 
     def add_toc_entry(self, title, level, slide_number):
         """ Adds a new entry to current presentation Table of Contents.
@@ -197,13 +365,29 @@ class Generator(object):
     def execute(self):
         """ Execute this generator regarding its current configuration.
         """
-        if self.direct:
+        if self.serve:
+            if self.split_output:
+                raise IOError(u"Split output mode is not available when "
+                               "serving the presentation")
+
+            from landslide.server import serve
+
+            serve(self, self.port, self.debounce)
+        elif self.direct:
             if self.file_type == 'pdf':
                 raise IOError(u"Direct output mode is not available for PDF "
                                "export")
+            elif self.split_output:
+                raise IOError(u"Direct output mode is not available for split "
+                               "output")
             else:
-                print(self.render().encode(self.encoding))
+                self.write_direct()
+                self.write_profile()
         else:
+            if self.split_output and self.file_type == 'pdf':
+                raise IOError(u"Split output mode is not available for PDF "
+                               "export")
+
             self.write_and_log()
 
             if self.watch:
@@ -211,14 +395,82 @@ class Generator(object):
 
                 self.log(u"Watching %s\n" % self.watch_dir)
 
-                watch(self.watch_dir, self.write_and_log)
-
-    def write_and_log(self):
+                ignore = [os.path.abspath(self.destination_file)]
+                if self.split_output:
+                    ignore.append(self.get_fragments_dir())
+                if self.bundle:
+                    ignore.append(self.bundle.directory)
+                if self.profile:
+                    ignore.append(os.path.abspath(self.profile))
+                watch(self.watch_dir, self.write_and_log, ignore=ignore,
+                      debounce=self.debounce)
+
+    def write_and_log(self, changed_paths=None, is_cancelled=None):
+        """ Writes the presentation and logs it. When ``changed_paths`` is
+            given, only the slides of those files are parsed again. The
+            ``is_cancelled`` callable is polled during the build, which
+            stops by raising ``BuildCancelled`` once it returns ``True``.
+        """
         self.watch_files = []
         self.num_slides = 0
         self.__toc = []
-        self.write()
-        self.log(u"Generated file: %s" % self.destination_file)
+        if changed_paths:
+            self.invalidate(changed_paths)
+        self.is_cancelled = is_cancelled
+        try:
+            with self.tracer.span('build'):
+                changed = self.write()
+        except BuildCancelled:
+            self.log(u"Cancelled build, sources changed again")
+            raise
+        finally:
+            self.is_cancelled = None
+            self.write_profile()
+        if changed:
+            self.log(u"Generated file: %s" % self.destination_file)
+        else:
+            self.log(u"Unchanged file: %s" % self.destination_file)
+
+    def render_changes(self, changed_paths=None, is_cancelled=None):
+        """ Returns the generated html code and the template context it was
+            rendered from, parsing again only the slides of ``changed_paths``
+            when given. ``is_cancelled`` is polled as in ``write_and_log``.
+        """
+        if changed_paths:
+            self.invalidate(changed_paths)
+        self.is_cancelled = is_cancelled
+        try:
+            with self.tracer.span('build'):
+                template = self.get_template()
+                context = self.get_context(template)
+                html = template.render(context)
+                if self.minify:
+                    html = self.minify_html(html)
+            self.check_cancelled()
+        except BuildCancelled:
+            self.log(u"Cancelled build, sources changed again")
+            raise
+        finally:
+            self.is_cancelled = None
+            self.write_profile()
+        return html, context
+
+    def check_cancelled(self):
+        """ Raises ``BuildCancelled`` if the running build became obsolete.
+        """
+        if self.is_cancelled and self.is_cancelled():
+            raise BuildCancelled(u"Build cancelled")
+
+    def get_template(self):
+        """ Loads the Jinja2 template through the shared environment of its
+            theme directory.
+        """
+        bytecode_cache_dir = None
+        if self.cache:
+            bytecode_cache_dir = os.path.join(self.cache_dir, 'templates')
+        environment = get_environment(os.path.dirname(self.template_file),
+                                      self.encoding, bytecode_cache_dir)
+        return environment.get_template(os.path.basename(self.template_file))
 
     def get_template_file(self):
         """ Retrieves Jinja2 template file path.
@@ -246,30 +498,53 @@ class Generator(object):
             for entry in entries:
                 slides.extend(self.fetch_contents(os.path.join(source, entry)))
         else:
-            try:
-                parser = Parser(os.path.splitext(source)[1], self.encoding,
-                    self.extensions)
-            except NotImplementedError:
+            parser = self.get_parser(source)
+            if not parser:
                 return slides
 
-            self.log(u"Adding   %s (%s)" % (source, parser.format))
-
-            try:
-                with codecs.open(source, encoding=self.encoding) as file:
-                    file_contents = file.read()
-            except UnicodeDecodeError:
-                self.log(u"Unable to decode source %s: skipping" % source,
-                         'warning')
-            else:
-                inner_slides = re.split(r'<hr.+>', parser.parse(file_contents))
-                for inner_slide in inner_slides:
-                    slides.append(self.get_slide_vars(inner_slide, source))
+            slides.extend(self.fetch_source_contents(source, parser))
 
         if not slides:
             self.log(u"Exiting  %s: no contents found" % source, 'notice')
 
         return slides
 
+    def fetch_source_contents(self, source, parser):
+        """ Returns the slides of a single source file, reusing the ones
+            kept in memory from a previous build when the file is unchanged.
+        """
+        key = os.path.abspath(source)
+        signature = self.get_source_signature(source)
+        if key in self.source_slides:
+            cached_signature, cached_slides = self.source_slides[key]
+            if cached_signature == signature:
+                if key in self.prefetched:
+                    self.prefetched.discard(key)
+                else:
+                    self.log(u"Reusing  %s (%s)" % (source, parser.format))
+                return cached_slides
+
+        self.check_cancelled()
+        self.log(u"Adding   %s (%s)" % (source, parser.format))
+
+        slides = self.parse_source(source, parser)
+        self.source_slides[key] = (signature, slides)
+        return slides
+
+    def find_sources(self, source):
+        """ Lists source file paths in the order ``fetch_contents`` walks
+            them.
+        """
+        if type(source) is list:
+            return [path for entry in source
+                    for path in self.find_sources(entry)]
+        elif os.path.isdir(source):
+            return [path for entry in sorted(os.listdir(source))
+                    for path in self.find_sources(os.path.join(source,
+                                                               entry))]
+        else:
+            return [source]
+
     def find_theme_dir(self, theme, copy_theme=False):
         """ Finds them dir path from its name.
         """
@@ -308,20 +583,20 @@ class Generator(object):
             if not os.path.exists(print_css):
                 raise IOError(u"Cannot find css/print.css in default theme")
 
-        with codecs.open(print_css, encoding=self.encoding) as css_file:
-            css['print'] = {
-                'path_url': utils.get_path_url(print_css, self.relative),
-                'contents': css_file.read(),
-            }
+        css['print'] = {
+            'path': print_css,
+            'path_url': utils.get_path_url(print_css, self.relative),
+            'contents': self.read_asset(print_css),
+        }
 
         screen_css = os.path.join(self.theme_dir, 'css', 'screen.css')
 
         if (os.path.exists(screen_css)):
-            with codecs.open(screen_css, encoding=self.encoding) as css_file:
-                css['screen'] = {
-                    'path_url': utils.get_path_url(screen_css, self.relative),
-                    'contents': css_file.read(),
-                }
+            css['screen'] = {
+                'path': screen_css,
+                'path_url': utils.get_path_url(screen_css, self.relative),
+                'contents': self.read_asset(screen_css),
+            }
         else:
             self.log(u"No screen stylesheet provided in current theme",
                       'warning')
@@ -339,11 +614,72 @@ class Generator(object):
 
             if not os.path.exists(js_file):
                 raise IOError(u"Cannot find slides.js in default theme")
-        with codecs.open(js_file, encoding=self.encoding) as js_file_obj:
-            return {
-                'path_url': utils.get_path_url(js_file, self.relative),
-                'contents': js_file_obj.read(),
-            }
+        return {
+            'path': js_file,
+            'path_url': utils.get_path_url(js_file, self.relative),
+            'contents': self.read_asset(js_file),
+        }
+
+    def get_user_assets(self, assets):
+        """ Returns the user css or js ``assets`` with their current file
+            contents, so that changes are picked up without a restart.
+        """
+        return [dict(asset, contents=self.read_asset(asset['path']))
+                if asset.get('path') else asset for asset in assets]
+
+    def has_user_asset(self, assets, path):
+        """ Checks whether the user asset at ``path`` was already added.
+        """
+        return any(asset.get('path', asset['path_url']) == path
+                   for asset in assets)
+
+    def get_source_signature(self, source):
+        """ Returns a cheap signature telling whether a source file changed
+            since it was last parsed.
+        """
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get_macro_pipeline(self):
+        """ Returns the registered macros, instantiated once and reused for
+            every slide of this presentation. Directive macros are grouped
+            in ``DirectiveScanner`` stages.
+        """
+        if self.macro_pipeline is None:
+            macro_options = {'relative': self.relative,
+                             'linenos': self.linenos,
+                             'bundle': self.bundle,
+                             'highlight_cache': self.highlight_cache,
+                             'image_processor': self.image_processor}
+            self.macro_pipeline = []
+            for macro_class in self.macros:
+                macro = macro_class(logger=self.logger, embed=self.embed,
+                                    options=macro_options)
+                if not macro.scans_directives():
+                    self.macro_pipeline.append(macro)
+                    continue
+                # consecutive directive macros share a single scanning pass
+                if not (self.macro_pipeline and isinstance(
+                        self.macro_pipeline[-1],
+                        macro_module.DirectiveScanner)):
+                    self.macro_pipeline.append(macro_module.DirectiveScanner(
+                        [], on_error=self.log_macro_error,
+                        tracer=self.tracer))
+                self.macro_pipeline[-1].add(macro)
+        return self.macro_pipeline
+
+    def get_parser(self, source):
+        """ Returns a parser for the given source file, or ``None`` if its
+            format isn't supported.
+        """
+        try:
+            return Parser(os.path.splitext(source)[1], self.encoding,
+                          self.extensions, self.highlight_cache)
+        except NotImplementedError:
+            return None
 
     def get_slide_vars(self, slide_src, source=None):
         """ Computes a single slide template vars from its html source code.
@@ -412,11 +748,40 @@ class Generator(object):
                 # Put something in the TOC even if it doesn't have a title or level
                 self.add_toc_entry(u"-", 1, slide_number)
 
+        for slide_vars in slides:
+            if slide_vars:
+                slide_vars['fingerprint'] = self.get_slide_fingerprint(
+                    slide_vars)
+
         return {'head_title': head_title, 'num_slides': str(self.num_slides),
                 'slides': slides, 'toc': self.toc, 'embed': self.embed,
                 'css': self.get_css(), 'js': self.get_js(),
-                'user_css': self.user_css, 'user_js': self.user_js,
-                'math_output': self.math_output}
+                'user_css': self.get_user_assets(self.user_css),
+                'user_js': self.get_user_assets(self.user_js),
+                'math_output': self.math_output,
+                'split_output': self.split_output}
+
+    def get_slide_fingerprint(self, slide_vars):
+        """ Returns a short hash of what a numbered slide is rendered from,
+            which only changes along with the slide markup.
+        """
+        return cache_module.hash_key(
+            slide_vars.get('header'), slide_vars.get('content'),
+            slide_vars.get('presenter_notes'),
+            u' '.join(slide_vars.get('classes') or []),
+            (slide_vars.get('source') or {}).get('rel_path', u''),
+            slide_vars['number'], self.num_slides)[:16]
+
+    def invalidate(self, paths):
+        """ Drops the in-memory slides of the given changed ``paths``. A
+            changed image may be embedded anywhere, so it drops them all.
+        """
+        for path in paths:
+            key = os.path.abspath(path)
+            if key in self.source_slides:
+                del self.source_slides[key]
+            elif (mimetypes.guess_type(key)[0] or '').startswith('image/'):
+                self.source_slides.clear()
 
     def linenos_check(self, value):
         """ Checks and returns a valid value for the ``linenos`` option.
@@ -431,6 +796,78 @@ class Generator(object):
         if self.verbose and self.logger:
             self.logger(message, type)
 
+    def read_asset(self, path):
+        """ Returns the contents of a theme or user asset file, read from
+            disk only when it changed since it was last loaded.
+        """
+        contents, hit = assets_module.registry.read(path, self.encoding)
+        if not hit:
+            self.log(u"Loading  %s" % path)
+        return contents
+
+    def log_image_report(self, report):
+        """ Logs the bytes saved on each processed image of an image
+            processing ``report``, and in total.
+        """
+        saved = 0
+        for path in sorted(report):
+            original, processed = report[path]
+            saved += original - processed
+            self.log(u"Resized  %s: %d -> %d bytes, %d saved (%d%%)"
+                     % (path, original, processed, original - processed,
+                        100 * (original - processed) // (original or 1)))
+        if report:
+            self.log(u"Resized  %d images, %d bytes saved"
+                     % (len(report), saved))
+
+    def log_macro_error(self, macro, source, error):
+        """ Logs a macro failure, which leaves the slide unaltered by it.
+        """
+        self.log(u"%s processing failed in %s: %s" % (macro, source, error))
+
+    def parse(self, parser, text, part=False):
+        """ Parses ``text`` with ``parser``, going through the parse cache
+            when it is enabled. ``part`` tells that the text is a part of a
+            split source. Texts reading other files aren't cached, as
+            changes to those files wouldn't show in the cache key.
+        """
+        if not self.parse_cache or parser.reads_files(text):
+            return parser.parse(text, part)
+        key = cache_module.hash_key(__version__, parser.format,
+                                    parser.get_versions(),
+                                    ','.join(parser.md_extensions),
+                                    parser.encoding, part, text)
+        html = self.parse_cache.get(key)
+        if html is None:
+            html = parser.parse(text, part)
+            self.parse_cache.set(key, html)
+        return html
+
+    def parse_source(self, source, parser):
+        """ Reads, parses and splits a single source file into slides.
+        """
+        slides = []
+        with self.tracer.span('parse_source', source=source,
+                              format=parser.format):
+            try:
+                with codecs.open(source, encoding=self.encoding) as file:
+                    file_contents = file.read()
+            except UnicodeDecodeError:
+                self.log(u"Unable to decode source %s: skipping" % source,
+                         'warning')
+                return slides
+
+            if self.split_sources:
+                texts = parser.split(file_contents)
+            else:
+                texts = [file_contents]
+            for text in texts:
+                with self.tracer.span('parse', format=parser.format):
+                    html = self.parse(parser, text, self.split_sources)
+                for inner_slide in re.split(r'<hr.+>', html):
+                    slides.append(self.get_slide_vars(inner_slide, source))
+        return slides
+
     def parse_config(self, config_source):
         """ Parses a landslide configuration file and returns a normalized
             python dict.
@@ -449,6 +886,8 @@ class Generator(object):
             self.log(u"Using    configured theme %s" % config['theme'])
         if raw_config.has_option('landslide', 'destination'):
             config['destination'] = raw_config.get('landslide', 'destination')
+        if raw_config.has_option('landslide', 'assets_dir'):
+            config['assets_dir'] = raw_config.get('landslide', 'assets_dir')
         if raw_config.has_option('landslide', 'linenos'):
             config['linenos'] = raw_config.get('landslide', 'linenos')
         for boolopt in ('embed', 'relative', 'copy_theme'):
@@ -465,21 +904,69 @@ class Generator(object):
                 .replace('\r', '').split('\n')
         return config
 
+    def prefetch_contents(self, source):
+        """ Parses the changed source files in a pool of ``jobs`` processes,
+            so ``fetch_contents`` then finds them in memory. Results are
+            keyed by file, which keeps the slides order of a serial build.
+            Generators which can't be pickled, for instance because of a
+            lambda logger, leave the sources to be parsed serially.
+        """
+        self.prefetched.clear()
+        tasks = []
+        for path in self.find_sources(source):
+            parser = self.get_parser(path)
+            key = os.path.abspath(path)
+            signature = self.get_source_signature(path)
+            if parser and self.source_slides.get(key, (None,))[0] != signature:
+                tasks.append((path, parser, key, signature))
+
+        if self.jobs < 2 or len(tasks) < 2:
+            return
+
+        # pickled up front, so that processes get the same generator whether
+        # they are forked or spawned
+        try:
+            state = pickle.dumps(self)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            self.log(u"Parsing  sources serially, the generator can't be "
+                     "sent to other processes: %s" % e)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(min(self.jobs, len(tasks)),
+                                       initializer=_init_worker,
+                                       initargs=(state,))
+        futures = []
+        try:
+            for path, parser, key, signature in tasks:
+                self.log(u"Adding   %s (%s)" % (path, parser.format))
+                futures.append(executor.submit(_parse_source_worker, path))
+            for future, (_, _, key, signature) in zip(futures, tasks):
+                self.check_cancelled()
+                slides, events, image_report = future.result()
+                self.tracer.add_events(events)
+                if self.image_processor:
+                    self.image_processor.add_report(image_report)
+                self.source_slides[key] = (signature, slides)
+                self.prefetched.add(key)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
+
     def process_macros(self, content, source=None):
         """ Processed all macros.
         """
-        macro_options = {'relative': self.relative, 'linenos': self.linenos}
         classes = []
-        for macro_class in self.macros:
+        for macro in self.get_macro_pipeline():
             try:
-                macro = macro_class(logger=self.logger, embed=self.embed,
-                    options=macro_options)
-                content, add_classes = macro.process(content, source)
+                with self.tracer.span(type(macro).__name__, 'macro'):
+                    content, add_classes = macro.process(content, source)
                 if add_classes:
                     classes += add_classes
             except Exception as e:
-                self.log(u"%s processing failed in %s: %s"
-                         % (macro, source, e))
+                self.log_macro_error(macro, source, e)
         return content, classes
 
     def register_macro(self, *macros):
@@ -488,6 +975,7 @@ class Generator(object):
         for m in macros:
             if inspect.isclass(m) and issubclass(m, macro_module.Macro):
                 self.macros.append(m)
+                self.macro_pipeline = None
             else:
                 raise TypeError("Coundn't register macro; a macro must inherit"
                                 " from macro.Macro")
@@ -495,80 +983,445 @@ class Generator(object):
     def render(self):
         """ Returns generated html code.
         """
-        with codecs.open(self.template_file, encoding=self.encoding) as template_src:
-            template = jinja2.Template(template_src.read())
-        slides = self.fetch_contents(self.source)
+        return u''.join(self.render_stream())
+
+    def render_stream(self):
+        """ Fetches the slides and returns an iterator over the generated html
+            code chunks, rendered as they are consumed, or all at once when
+            minifying.
+        """
+        template = self.get_template()
+        chunks = template.generate(self.get_context(template))
+
+        # rendering is timed apart from writing when profiling
+        if self.tracer.enabled:
+            with self.tracer.span('render'):
+                chunks = list(chunks)
+
+        # the whole document is needed to tell where whitespace matters
+        if self.minify:
+            chunks = [self.minify_html(u''.join(chunks))]
+
+        return chunks
+
+    def get_context(self, template):
+        """ Fetches the slides and returns the context ``template`` is
+            rendered with.
+        """
+        registry = assets_module.registry
+        hits, misses = registry.hits, registry.misses
+        with self.tracer.span('prefetch_contents'):
+            self.prefetch_contents(self.source)
+        with self.tracer.span('fetch_contents'):
+            slides = self.fetch_contents(self.source)
+        if self.image_processor:
+            self.log_image_report(self.image_processor.flush())
+        self.num_slides = 0
+        self.__toc = []
         context = self.get_template_vars(slides)
 
-        html = template.render(context)
+        # themes using the image table get repeated images embedded once,
+        # fragments of split outputs hold their own images
+        if self.embed and self.file_type == 'html' and \
+                not self.split_output and \
+                'image_table' in get_template_variables(template):
+            with self.tracer.span('share_images'):
+                context['slides'], context['image_table'] = \
+                    self.share_images(context['slides'])
+
+        # linked assets are left as they are
+        if self.minify and (self.embed or self.bundle):
+            with self.tracer.span('minify_assets'):
+                (context['css'], context['js'], context['user_css'],
+                 context['user_js']) = self.minify_assets(
+                    context['css'], context['js'], context['user_css'],
+                    context['user_js'])
 
         if self.embed:
-            images = re.findall(r'url\(["\']?(.*?\.(?:jpe?g|gif|png|svg)[\'"]?)\)',
-                html, re.DOTALL | re.UNICODE)
+            with self.tracer.span('embed_theme_images'):
+                context['css'], context['user_css'] = self.embed_theme_images(
+                    context['css'], context['user_css'])
+        elif self.bundle:
+            with self.tracer.span('bundle_assets'):
+                (context['css'], context['js'], context['user_css'],
+                 context['user_js']) = self.bundle_assets(
+                    context['css'], context['js'], context['user_css'],
+                    context['user_js'])
+                # slides kept from earlier builds bundled their images then
+                self.bundle.use(u''.join(
+                    slide[key] or u'' for slide in context['slides'] if slide
+                    for key in ('header', 'content', 'presenter_notes')))
+
+        self.log(u"Assets   %d loaded, %d cached"
+                 % (registry.misses - misses, registry.hits - hits))
+        return context
+
+    def embed_theme_images(self, css, user_css):
+        """ Embeds the images referenced by ``url()`` in the theme and user
+            stylesheets, looking for them in the theme then in the user css
+            directories. Returns the updated ``css`` and ``user_css``.
+        """
+        directories = self.get_theme_image_dirs(user_css)
+        encoded_urls = {}
+
+        def embed_image(match):
+            img_url = match.group('url')
+            if img_url not in encoded_urls:
+                encoded_urls[img_url] = self.encode_theme_image(img_url,
+                                                                directories)
+            if not encoded_urls[img_url]:
+                return match.group(0)
+            return match.group(0).replace(img_url, encoded_urls[img_url], 1)
+
+        def embed_images(entry):
+            return dict(entry, contents=THEME_IMAGE_RE.sub(embed_image,
+                                                           entry['contents']))
+
+        return (dict((name, embed_images(entry)) for name, entry in css.items()),
+                [embed_images(entry) for entry in user_css])
+
+    def get_theme_image_dirs(self, user_css):
+        """ Returns the directories the images referenced by stylesheets are
+            looked for in: the theme css directory, then the ones of the
+            ``user_css`` files.
+        """
+        if self.theme_dir:
+            theme_css_dir = os.path.join(self.theme_dir, 'css')
+        else:
+            theme_css_dir = os.path.join(THEMES_DIR, self.theme, 'css')
+        return [theme_css_dir] + [
+            os.path.dirname(entry.get('path', entry['path_url'])) or '.'
+            for entry in user_css]
+
+    def bundle_assets(self, css, js, user_css, user_js):
+        """ Copies the theme and user assets to the assets directory, along
+            with the images referenced by the stylesheets, which link to
+            their copies. Returns the updated ``css``, ``js``, ``user_css``
+            and ``user_js``, linking to the copied files.
+        """
+        directories = self.get_theme_image_dirs(user_css)
+
+        def bundle_image(match):
+            img_url = match.group('url')
+            if '://' in img_url or img_url.startswith('/'):
+                return match.group(0)
+            for directory in directories:
+                path = os.path.join(directory, img_url)
+                if os.path.isfile(path):
+                    # stylesheets are bundled along with their images
+                    return match.group(0).replace(
+                        img_url, self.bundle.add_file(path), 1)
+            self.log(u"Failed to bundle theme image %s" % img_url)
+            return match.group(0)
+
+        def bundle_css(entry):
+            if not entry.get('path'):
+                return entry
+            contents = THEME_IMAGE_RE.sub(bundle_image, entry['contents'])
+            name = self.bundle.add(os.path.basename(entry['path']),
+                                   contents.encode('utf_8'))
+            return dict(entry, path_url=self.bundle.url(name))
+
+        def bundle_js(entry):
+            if not entry.get('path'):
+                return entry
+            if self.minify:
+                name = self.bundle.add(os.path.basename(entry['path']),
+                                       entry['contents'].encode('utf_8'))
+            else:
+                name = self.bundle.add_file(entry['path'])
+            return dict(entry, path_url=self.bundle.url(name))
 
-            for img_url in images:
-                img_url = img_url.replace('"', '').replace("'", '')
-                if self.theme_dir:
-                    source = os.path.join(self.theme_dir, 'css')
-                else:
-                    source = os.path.join(THEMES_DIR, self.theme, 'css')
+        return (dict((name, bundle_css(entry)) for name, entry in css.items()),
+                bundle_js(js), [bundle_css(entry) for entry in user_css],
+                [bundle_js(entry) for entry in user_js])
 
-                encoded_url = utils.encode_image_from_url(img_url, source)
-                if encoded_url:
-                    html = html.replace(img_url, encoded_url, 1)
-                    self.log("Embedded theme image %s from theme directory %s" % (img_url, source))
-                else:
-                    # Missing file in theme directory. Try user_css folders
-                    found = False
-                    for css_entry in context['user_css']:
-                        directory = os.path.dirname(css_entry['path_url'])
-                        if not directory:
-                            directory = "."
+    def minify_assets(self, css, js, user_css, user_js):
+        """ Minifies the contents of the theme and user stylesheets and
+            scripts. Returns the updated ``css``, ``js``, ``user_css`` and
+            ``user_js``.
+        """
+        sizes = [0, 0]
+
+        def minify_entry(entry, kind):
+            if not entry.get('contents'):
+                return entry
+            contents = self.minify_asset(kind, entry['contents'])
+            sizes[0] += len(entry['contents'])
+            sizes[1] += len(contents)
+            return dict(entry, contents=contents)
+
+        css = dict((name, minify_entry(entry, 'css'))
+                   for name, entry in css.items())
+        js = minify_entry(js, 'js')
+        user_css = [minify_entry(entry, 'css') for entry in user_css]
+        user_js = [minify_entry(entry, 'js') for entry in user_js]
+
+        self.log(u"Minified stylesheets and scripts: %d -> %d bytes"
+                 % tuple(sizes))
+        return css, js, user_css, user_js
+
+    def minify_asset(self, kind, contents):
+        """ Returns the minified ``contents`` of a ``css`` or ``js`` asset,
+            cached by contents in memory and in the persistent cache.
+        """
+        key = cache_module.hash_key(__version__, kind, contents)
+        minified = self.minified_assets.get(key)
+        if minified is None and self.minify_cache:
+            minified = self.minify_cache.get(key)
+        if minified is None:
+            if kind == 'css':
+                minified = minify_module.minify_css(contents)
+            else:
+                minified = minify_module.minify_js(contents)
+            if self.minify_cache:
+                self.minify_cache.set(key, minified)
+        self.minified_assets[key] = minified
+        return minified
+
+    def minify_html(self, html):
+        """ Returns ``html`` with its comments and insignificant whitespace
+            removed.
+        """
+        with self.tracer.span('minify_html'):
+            return minify_module.minify_html(html)
 
-                        encoded_url = utils.encode_image_from_url(img_url, directory)
+    def encode_theme_image(self, img_url, directories):
+        """ Returns the data uri of a theme image, found in the first of
+            ``directories`` containing it, or ``False``.
+        """
+        for index, directory in enumerate(directories):
+            encoded_url = utils.encode_image_from_url(img_url, directory)
+            if encoded_url:
+                if index == 0:
+                    self.log(u"Embedded theme image %s from theme directory %s"
+                             % (img_url, directory))
+                else:
+                    self.log(u"Embedded theme image %s from directory %s"
+                             % (img_url, directory))
+                return encoded_url
+
+        # Missing image file, etc...
+        self.log(u"Failed to embed theme image %s" % img_url)
+        return False
+
+    def share_images(self, slides):
+        """ Moves the images embedded more than once in ``slides``, or all of
+            them with ``lazy_images``, to a table of data URIs, which slides
+            reference with a ``data-image`` attribute instead of a ``src``
+            one. Returns copies of the slides along with the table.
+        """
+        counts = {}
+        for slide in slides:
+            for field in ('header', 'content', 'presenter_notes'):
+                if slide and slide.get(field):
+                    for match in EMBEDDED_IMAGE_RE.finditer(slide[field]):
+                        url = match.group('url')
+                        counts[url] = counts.get(url, 0) + 1
+
+        image_table = {}
+        image_keys = {}
+        for url, count in counts.items():
+            if count > 1 or self.lazy_images:
+                image_keys[url] = 'image%d' % len(image_keys)
+                image_table[image_keys[url]] = url
+
+        if not image_table:
+            return slides, image_table
+
+        if self.lazy_images:
+            self.log(u"Deferring %d embedded images" % len(image_table))
+        else:
+            self.log(u"Sharing  %d images embedded more than once"
+                     % len(image_table))
+
+        def replace(match):
+            if match.group('url') in image_keys:
+                return '%sdata-image="%s"' % (match.group('tag'),
+                                              image_keys[match.group('url')])
+            return match.group(0)
+
+        shared_slides = []
+        for slide in slides:
+            if slide:
+                slide = dict(slide)
+                for field in ('header', 'content', 'presenter_notes'):
+                    if slide.get(field):
+                        slide[field] = EMBEDDED_IMAGE_RE.sub(replace,
+                                                             slide[field])
+            shared_slides.append(slide)
+        return shared_slides, image_table
 
-                        if encoded_url:
-                            found = True
-                            html = html.replace(img_url, encoded_url, 1)
-                            self.log("Embedded theme image %s from directory %s" % (img_url, directory))
+    def write(self):
+        """ Writes generated presentation code into the destination file,
+            unless it already holds the same code, then removes the bundled
+            assets it no longer links to. Returns whether the file changed.
+        """
+        if self.split_output:
+            changed = self.write_split()
+        else:
+            chunks = self.render_stream()
+            self.check_cancelled()
 
-                    if not found:
-                        # Missing image file, etc...
-                        self.log(u"Failed to embed theme image %s" % img_url)
+            with self.tracer.span('write',
+                                  destination=self.destination_file):
+                if self.file_type == 'pdf':
+                    changed = self.write_pdf(chunks)
+                else:
+                    changed = utils.write_if_changed(
+                        self.destination_file,
+                        (chunk.encode('utf_8') for chunk in chunks))
 
-        return html
+        if self.bundle:
+            self.bundle.prune(self.destination_file)
+        return changed
 
-    def write(self):
-        """ Writes generated presentation code into the destination file.
+    def get_fragments_dir(self):
+        """ Returns the directory the fragments of a split output are written
+            to, next to the destination file.
+        """
+        return u"%s_fragments" % os.path.splitext(
+            os.path.abspath(self.destination_file))[0]
+
+    def write_split(self):
+        """ Writes the presentation as a shell page holding the table of
+            contents and slide placeholders, plus the slides as fragment
+            scripts, one per slide or per source file, loaded on demand by
+            the theme javascript. Only changed files are written. Returns
+            whether any file changed.
         """
-        html = self.render()
+        template = self.get_template()
+        if 'split_output' not in get_template_variables(template):
+            raise IOError(u"The %s theme doesn't support split output"
+                          % self.theme)
+        context = self.get_context(template)
+        self.check_cancelled()
+
+        fragments_dir = self.get_fragments_dir()
+        fragments_url = os.path.basename(fragments_dir)
+        fragments = {}
+        sources = {}
+        slides = []
+        for slide in context['slides']:
+            if slide:
+                if self.split_output == 'slide':
+                    name = u"slide-%04d.js" % slide['number']
+                else:
+                    rel_path = slide['source'].get('rel_path', u'')
+                    name = u"source-%03d.js" % sources.setdefault(
+                        rel_path, len(sources) + 1)
+                fragments.setdefault(name, []).append(slide)
+                slide = dict(slide, fragment=u"%s/%s" % (fragments_url, name))
+            slides.append(slide)
+        context['slides'] = slides
+
+        slide_template = template.environment.get_template('slide.html')
+        with self.tracer.span('write', destination=self.destination_file):
+            if not os.path.isdir(fragments_dir):
+                os.makedirs(fragments_dir)
+            chunks = template.generate(context)
+            if self.minify:
+                chunks = [self.minify_html(u''.join(chunks))]
+            changed = utils.write_if_changed(
+                self.destination_file,
+                (chunk.encode('utf_8') for chunk in chunks))
+
+            for name, fragment_slides in fragments.items():
+                html = u''.join(slide_template.render(context, slide=slide)
+                                for slide in fragment_slides)
+                if self.minify:
+                    html = self.minify_html(html)
+                script = u"addSlideFragment(%s);\n" % json.dumps(html)
+                changed |= utils.write_if_changed(
+                    os.path.join(fragments_dir, name),
+                    [script.encode('utf_8')])
+
+            # fragments of slides or sources which went away
+            for name in os.listdir(fragments_dir):
+                if name not in fragments and \
+                        SPLIT_FRAGMENT_RE.match(name):
+                    os.remove(os.path.join(fragments_dir, name))
+                    changed = True
+
+        self.log(u"Wrote    %d fragments to %s" % (len(fragments),
+                                                   fragments_dir))
+        return changed
+
+    def write_direct(self):
+        """ Writes generated presentation code to the standard output.
+        """
+        stdout = getattr(sys.stdout, 'buffer', None)
+        for chunk in self.render_stream():
+            if stdout:
+                stdout.write(chunk.encode(self.encoding, 'xmlcharrefreplace'))
+            else:
+                sys.stdout.write(chunk)
+        sys.stdout.flush()
 
-        if self.file_type == 'pdf':
-            self.write_pdf(html)
-        else:
-            with codecs.open(self.destination_file, 'w',
-                             encoding='utf_8') as outfile:
-                outfile.write(html)
+    def write_profile(self):
+        """ Writes the timeline of the last build to the ``profile`` file,
+            when profiling is enabled.
+        """
+        if self.profile:
+            self.tracer.write(self.profile)
+            self.log(u"Profile  %s" % self.profile)
 
     def write_pdf(self, html):
         """ Tries to write a PDF export from the command line using Prince if
-            available.
+            available. The ``html`` code can be given as a string or as an
+            iterable of chunks. Returns whether the PDF file changed.
         """
+        if isinstance(html, str):
+            html = [html]
+
         try:
             f = tempfile.NamedTemporaryFile(delete=False, suffix='.html')
-            f.write(html.encode('utf_8', 'xmlcharrefreplace'))
+            for chunk in html:
+                f.write(chunk.encode('utf_8', 'xmlcharrefreplace'))
             f.close()
         except Exception:
             raise IOError(u"Unable to create temporary file, aborting")
 
         dummy_fh = open(os.path.devnull, 'w')
+        fd, pdf_path = utils.make_temp_file(self.destination_file)
+        os.close(fd)
 
         try:
-            command = ["prince", f.name, "-o", self.destination_file]
+            command = ["prince", f.name, "-o", pdf_path]
 
             Popen(command, stderr=dummy_fh).communicate()
+            if not os.path.getsize(pdf_path):
+                raise IOError(u"Prince wrote no PDF")
+            return utils.replace_if_changed(pdf_path, self.destination_file)
         except Exception:
             raise EnvironmentError(u"Unable to generate PDF file using "
                                     "prince. Is it installed and available?")
         finally:
             dummy_fh.close()
+            os.remove(f.name)
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+
+
+_worker_generator = None
+
+
+def _init_worker(state):
+    """ Sets up a parsing process with a copy of the calling generator,
+        pickled as ``state``.
+    """
+    global _worker_generator
+    _worker_generator = pickle.loads(state)
+
+
+def _parse_source_worker(source):
+    """ Parses a single source file in a parsing process, returning its
+        slides along with the trace events and image processing report
+        recorded meanwhile.
+    """
+    slides = _worker_generator.parse_source(
+        source, _worker_generator.get_parser(source))
+    image_report = {}
+    if _worker_generator.image_processor:
+        image_report = _worker_generator.image_processor.flush()
+    return slides, _worker_generator.tracer.flush(), image_report
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+from . import cache as cache_module
+
+
+MEMORY_CACHE_SIZE = 4096
+
+VALID_LINENOS = ('no', 'inline', 'table')
+
+_lexers = {}
+_formatters = {}
+_highlighted = OrderedDict()
+
+
+def _options_key(options):
+    return tuple(sorted((name, tuple(value) if isinstance(value, list)
+                         else value) for name, value in options.items()))
+
+
+def get_lexer(language, **options):
+    """Returns a shared Pygments lexer for ``language``; raises
+       ``ValueError`` if the language is unknown"""
+    key = (language, _options_key(options))
+    if key not in _lexers:
+        from pygments.lexers import get_lexer_by_name
+        _lexers[key] = get_lexer_by_name(language, **options)
+    return _lexers[key]
+
+
+def get_formatter(**options):
+    """Returns a shared Pygments HTML formatter for the given options"""
+    key = _options_key(options)
+    if key not in _formatters:
+        from pygments.formatters import HtmlFormatter
+        _formatters[key] = HtmlFormatter(**options)
+    return _formatters[key]
+
+
+def highlight(code, language, lexer_options=None, disk_cache=None,
+              **formatter_options):
+    """Highlights ``code`` as HTML, memoizing the result by code hash and
+       settings, in memory and in ``disk_cache``, an optional
+       ``cache.FileCache`` persisting highlighted code across processes"""
+    import pygments
+
+    lexer_options = lexer_options or {}
+    key = cache_module.hash_key(pygments.__version__, language,
+                                _options_key(lexer_options),
+                                _options_key(formatter_options), code)
+
+    if key in _highlighted:
+        _highlighted.move_to_end(key)
+        return _highlighted[key]
+
+    html = disk_cache.get(key) if disk_cache else None
+    if html is None:
+        html = pygments.highlight(code, get_lexer(language, **lexer_options),
+                                  get_formatter(**formatter_options))
+        if disk_cache:
+            disk_cache.set(key, html)
+
+    _highlighted[key] = html
+    if len(_highlighted) > MEMORY_CACHE_SIZE:
+        _highlighted.popitem(last=False)
+    return html
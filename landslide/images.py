@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+
+from . import __version__
+from . import cache as cache_module
+
+# Pillow formats of the images which get downscaled and recompressed, other
+# images are embedded as they are
+PROCESSED_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/png': 'PNG',
+    'image/webp': 'WEBP',
+}
+
+
+def parse_size(value):
+    """ Parses a ``WIDTHxHEIGHT`` maximum image size into a tuple.
+    """
+    if isinstance(value, (tuple, list)):
+        size = tuple(value)
+    else:
+        try:
+            size = tuple(int(part) for part in value.lower().split('x'))
+        except ValueError:
+            size = ()
+    if len(size) != 2 or min(size) < 1:
+        raise ValueError(u"Invalid image size %s, expected WIDTHxHEIGHT"
+                         % (value,))
+    return size
+
+
+class ImageProcessor(object):
+    """ Downscales images to fit within ``max_size`` and recompresses them
+        before they are embedded. Processed images are kept in ``cache`` by
+        source contents and settings, and the bytes saved on each image are
+        recorded until they're ``flush``-ed into a report.
+    """
+    def __init__(self, max_size, quality=85, cache=None):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise RuntimeError(u"Looks like Pillow is not installed, it's "
+                               "required to process images")
+        self.max_size = parse_size(max_size)
+        self.quality = quality
+        self.cache = cache
+        self.key = u"%dx%d:%d" % (self.max_size + (self.quality,))
+        self.report = {}
+
+    def process(self, path, contents, mime_type):
+        """ Returns the processed ``contents`` of the image at ``path``, or
+            the original ones when they can't be made smaller.
+        """
+        image_format = PROCESSED_FORMATS.get(mime_type)
+        if not image_format:
+            return contents
+
+        key = cache_module.hash_key(__version__, self.key, contents)
+        processed = self.cache.get_bytes(key) if self.cache else None
+        if processed is None:
+            processed = self.recompress(contents, image_format)
+            if self.cache:
+                self.cache.set_bytes(key, processed)
+
+        self.report[os.path.abspath(path)] = (len(contents), len(processed))
+        return processed
+
+    def recompress(self, contents, image_format):
+        """ Downscales and recompresses image ``contents`` with Pillow.
+        """
+        from PIL import Image, ImageOps
+
+        with Image.open(io.BytesIO(contents)) as image:
+            if getattr(image, 'is_animated', False):
+                return contents
+            # the orientation of photos is lost along with their metadata
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(self.max_size, Image.LANCZOS)
+
+            options = {'optimize': True}
+            if image_format in ('JPEG', 'WEBP'):
+                options['quality'] = self.quality
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            output = io.BytesIO()
+            image.save(output, image_format, **options)
+
+        processed = output.getvalue()
+        return processed if len(processed) < len(contents) else contents
+
+    def add_report(self, report):
+        """ Adds the report of another processor, in a parsing process.
+        """
+        self.report.update(report)
+
+    def flush(self):
+        """ Returns the original and processed sizes of the images processed
+            since the last call, by path, and forgets them.
+        """
+        report, self.report = self.report, {}
+        return report
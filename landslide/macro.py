@@ -3,20 +3,32 @@
 import os
 import re
 import sys
-import pygments
 import html.entities
 
 from . import utils
-
-from pygments.lexers import get_lexer_by_name
-from pygments.formatters import HtmlFormatter
+from . import highlight
+from . import tracing
 
 
 class Macro(object):
-    """Base class for altering slide HTML during presentation generation"""
+    """Base class for altering slide HTML during presentation generation.
+
+       A generator creates a single instance of each registered macro and
+       reuses it for every slide header and content block. ``process`` must
+       therefore keep per-call state in local variables, treat ``options`` as
+       read-only and return everything it computed: the processed content and
+       the css classes to add to the slide.
+
+       Macros setting ``directive`` to one of the ``DirectiveScanner`` kinds
+       don't scan the content themselves: they implement ``handle_directive``
+       instead, and keep their per-call state in the ``DirectiveState`` they
+       are given. Subclasses overriding ``process`` are run through it.
+    """
 
     options = {}
 
+    directive = None
+
     def __init__(self, logger=sys.stdout, embed=False, options=None):
         self.logger = logger
         self.embed = embed
@@ -26,9 +38,132 @@ class Macro(object):
             self.options = options
 
     def process(self, content, source=None):
-        """Generic processor (does actually nothing)"""
+        """Generic processor (does actually nothing, unless the macro handles
+           a directive)"""
+        if self.directive:
+            return DirectiveScanner([self]).process(content, source)
         return content, []
 
+    def handle_directive(self, directive, state):
+        """Alters a ``Directive`` found by the scanner in place"""
+        pass
+
+    def scans_directives(self):
+        """Tells whether this macro can be run by a ``DirectiveScanner``,
+           which is not the case of subclasses with their own ``process``"""
+        return bool(self.directive) and type(self).process is Macro.process
+
+    def log(self, message, type='notice'):
+        """Logs a message with the ``logger`` callable, if any"""
+        if callable(self.logger):
+            self.logger(message, type)
+
+
+class Directive(object):
+    """A slide directive found by the ``DirectiveScanner``.
+
+       Handlers replace ``text`` to change the directive html, or ``src`` for
+       ``img`` directives, which only rewrites the image source.
+    """
+
+    def __init__(self, kind, match):
+        self.kind = kind
+        self.match = match
+        self.text = match.group(0)
+        self.src = match.group('src') if kind == 'img' else None
+
+    def render(self):
+        if self.src is None:
+            return self.text
+        start, end = self.match.span('src')
+        return self.text[:start - self.match.start()] + self.src \
+            + self.text[end - self.match.start():]
+
+
+class DirectiveState(object):
+    """Per-call state of a macro handling directives in a slide fragment.
+
+       Handlers append the css classes to add to the slide to ``classes``,
+       and set ``stopped`` to skip the remaining directives of the fragment.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.classes = []
+        self.stopped = False
+
+
+class DirectiveScanner(object):
+    """Finds the ``.fx:``, ``.notes:`` and ``.qr:`` markers and the image
+       sources of a slide fragment in a single pass, dispatches them to the
+       macros handling them, and rebuilds the content once. Handler calls are
+       recorded as spans of ``tracer``. A macro failing on a fragment leaves
+       it unaltered: the fragment is scanned again without that macro"""
+
+    directive_re = re.compile(
+        r'(?P<fx><p>\.fx:\s?(?P<fx_classes>(?s:.*?))</p>\n?)'
+        r'|(?P<notes><p>\.notes:\s?)(?=.*?</p>)'
+        r'|(?P<qr><p>\.qr:\s?(?P<qr_size>\d*?)\|(?P<qr_data>.*?)</p>)'
+        r'|(?P<img><img\s(?:[^>]*?\s)?src="(?P<src>[^"]*)")',
+        re.UNICODE)
+
+    def __init__(self, macros, on_error=None, tracer=None):
+        self.macros = []
+        self.handlers = {}
+        self.on_error = on_error
+        self.tracer = tracer or tracing.NullTracer()
+        for macro in macros:
+            self.add(macro)
+
+    def __repr__(self):
+        return '<DirectiveScanner %r>' % self.macros
+
+    def add(self, macro):
+        """Dispatches the directives of ``macro.directive`` kind to it"""
+        self.handlers.setdefault(macro.directive, []).append(len(self.macros))
+        self.macros.append(macro)
+
+    def process(self, content, source=None):
+        failed = set()
+        while True:
+            result = self.scan(content, source, failed)
+            if result is not None:
+                return result
+
+    def scan(self, content, source, failed):
+        """Scans ``content`` once, skipping the macros whose indexes are in
+           ``failed``. Returns the processed content and classes, or ``None``
+           when a macro failed, after adding it to ``failed``"""
+        states = [DirectiveState(source) for macro in self.macros]
+        pieces = []
+        position = 0
+
+        for match in self.directive_re.finditer(content):
+            directive = Directive(match.lastgroup, match)
+
+            for index in self.handlers.get(directive.kind, []):
+                if states[index].stopped or index in failed:
+                    continue
+                macro = self.macros[index]
+                try:
+                    with self.tracer.span(type(macro).__name__, 'directive'):
+                        macro.handle_directive(directive, states[index])
+                except Exception as e:
+                    if not self.on_error:
+                        raise
+                    failed.add(index)
+                    self.on_error(macro, source, e)
+                    return None
+
+            pieces.append(content[position:match.start()])
+            pieces.append(directive.render())
+            position = match.end()
+
+        pieces.append(content[position:])
+
+        return u''.join(pieces), [cls for state in states
+                                  for cls in state.classes]
+
 
 class CodeHighlightingMacro(Macro):
     """Performs syntax coloration in slide code blocks using Pygments"""
@@ -54,121 +189,118 @@ class CodeHighlightingMacro(Macro):
         classes = []
         for block, void1, lang, code, void2 in code_blocks:
             try:
-                lexer = get_lexer_by_name(lang, startinline=True)
+                highlight.get_lexer(lang, startinline=True)
             except Exception:
-                self.logger(u"Unknown pygment lexer \"%s\", skipping"
-                            % lang, 'warning')
+                self.log(u"Unknown pygment lexer \"%s\", skipping"
+                         % lang, 'warning')
                 return content, classes
 
-            if 'linenos' not in self.options or self.options['linenos'] =='no':
-                self.options['linenos'] = False
+            linenos = self.options.get('linenos', False)
+            if linenos == 'no':
+                linenos = False
 
-            formatter = HtmlFormatter(linenos=self.options['linenos'],
-                                      nobackground=True)
-            pretty_code = pygments.highlight(self.descape(code), lexer,
-                                             formatter)
+            pretty_code = highlight.highlight(
+                self.descape(code), lang, {'startinline': True},
+                disk_cache=self.options.get('highlight_cache'),
+                linenos=linenos, nobackground=True)
             content = content.replace(block, pretty_code, 1)
 
         return content, [u'has_code']
 
 
 class EmbedImagesMacro(Macro):
-    """Encodes images in base64 for embedding in image:data"""
+    """Encodes images in base64 for embedding in image:data, once processed
+       by the ``image_processor`` option if any"""
 
-    def process(self, content, source=None):
-        classes = []
+    directive = 'img'
 
+    def handle_directive(self, directive, state):
         if not self.embed:
-            return content, classes
-
-        images = re.findall(r'<img\s.*?src="(.+?)"\s?.*?/?>', content,
-                            re.DOTALL | re.UNICODE)
-
-        source_dir = os.path.dirname(source)
-
-        for image_url in images:
-            encoded_url = utils.encode_image_from_url(image_url, source_dir)
+            state.stopped = True
+            return
 
-            if not encoded_url:
-                self.logger(u"Failed to embed image \"%s\"" % image_url, 'warning')
-                return content, classes
+        image_url = directive.src
+        encoded_url = utils.encode_image_from_url(
+            image_url, os.path.dirname(state.source),
+            self.options.get('image_processor'))
 
-            content = content.replace(u"src=\"" + image_url,
-                                      u"src=\"" + encoded_url, 1)
+        if not encoded_url:
+            self.log(u"Failed to embed image \"%s\"" % image_url, 'warning')
+            state.stopped = True
+            return
 
-            self.logger(u"Embedded image %s" % image_url, 'notice')
+        directive.src = encoded_url
 
-        return content, classes
+        self.log(u"Embedded image %s" % image_url, 'notice')
 
 
 class FixImagePathsMacro(Macro):
-    """Replaces html image paths with fully qualified absolute urls"""
+    """Replaces html image paths with fully qualified absolute urls, or with
+       the urls of their copies in the ``bundle`` option asset bundle"""
 
     relative = False
 
-    def process(self, content, source=None):
-        classes = []
+    directive = 'img'
 
-        if self.embed:
-            return content, classes
+    absolute_url_re = re.compile(r'https?://|file://|data:')
 
-        base_path = utils.get_path_url(source, self.options.get('relative'))
+    def handle_directive(self, directive, state):
+        if self.embed:
+            state.stopped = True
+            return
+
+        if self.absolute_url_re.match(directive.src):
+            return
+
+        bundle = self.options.get('bundle')
+        if bundle:
+            image_path = os.path.join(os.path.dirname(state.source or ''),
+                                      directive.src)
+            if not os.path.isfile(image_path):
+                self.log(u"Failed to bundle image \"%s\"" % directive.src,
+                         'warning')
+                return
+            directive.src = bundle.url(bundle.add_file(image_path))
+            self.log(u"Bundled image %s" % image_path, 'notice')
+            return
+
+        base_path = utils.get_path_url(state.source,
+                                       self.options.get('relative'))
         base_url = os.path.split(base_path)[0]
 
-        regex = r'<img.*?src="(?!https?://|file://)(.*?)".*?/?>'
-
-        images = re.findall(regex, content, re.DOTALL | re.UNICODE)
-
-        for image in list(set(images)):
-            full_path = '"' + os.path.join(base_url, image) + '"'
-            image = '"' + image + '"'
-
-            content = content.replace(image, full_path)
-
-        return content, classes
+        directive.src = os.path.join(base_url, directive.src)
 
 
 class FxMacro(Macro):
     """Adds custom CSS class to slides"""
 
-    def process(self, content, source=None):
-        classes = []
-
-        fx_match = re.search(r'(<p>\.fx:\s?(.*?)</p>\n?)', content,
-                             re.DOTALL | re.UNICODE)
-        if fx_match:
-            classes = fx_match.group(2).split(u' ')
-            content = content.replace(fx_match.group(1), '', 1)
+    directive = 'fx'
 
-        return content, classes
+    def handle_directive(self, directive, state):
+        state.classes.extend(directive.match.group('fx_classes').split(u' '))
+        directive.text = u''
+        state.stopped = True
 
 
 class NotesMacro(Macro):
     """Adds toggleable notes to slides"""
 
-    def process(self, content, source=None):
-        classes = []
-
-        new_content = re.sub(r'<p>\.notes:\s?(.*?)</p>',
-                             r'<p class="notes">\1</p>', content)
-
-        if content != new_content:
-            classes.append(u'has_notes')
+    directive = 'notes'
 
-        return new_content, classes
+    def handle_directive(self, directive, state):
+        directive.text = u'<p class="notes">'
+        if u'has_notes' not in state.classes:
+            state.classes.append(u'has_notes')
 
 
 class QRMacro(Macro):
     """Generates a QR code in a slide"""
 
-    def process(self, content, source=None):
-        classes = []
-
-        new_content = re.sub(r'<p>\.qr:\s?(\d*?)\|(.*?)</p>',
-                             r'<p class="qr"><img src="https://chart.apis.google.com/chart?chs=\1x\1&cht=qr&chl=\2&chf=bg,s,00000000&choe=UTF-8" alt="QR Code" /></p>',
-                             content)
+    directive = 'qr'
 
-        if content != new_content:
-            classes.append(u'has_qr')
+    qr_html = r'<p class="qr"><img src="https://chart.apis.google.com/chart?chs=\g<qr_size>x\g<qr_size>&cht=qr&chl=\g<qr_data>&chf=bg,s,00000000&choe=UTF-8" alt="QR Code" /></p>'
 
-        return new_content, classes
+    def handle_directive(self, directive, state):
+        directive.text = directive.match.expand(self.qr_html)
+        if u'has_qr' not in state.classes:
+            state.classes.append(u'has_qr')
@@ -2,10 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import glob
+import time
 
 from optparse import OptionParser
 
-from . import generator
+from . import highlight
 from . import __version__
 
 
@@ -13,13 +15,24 @@ def _parse_options():
     """Parses landslide's command line options"""
 
     parser = OptionParser(
-        usage="%prog [options] input.md ...",
+        usage="%prog [options] input.md ...\n"
+              "       %prog [options] deck.cfg other.cfg 'decks/*.cfg'",
         description="Generates an HTML5 or PDF "
                     "slideshow from Markdown or other formats",
         epilog="Note: PDF export requires the `prince` program: "
                "http://princexml.com/",
         version="%prog " + __version__)
 
+    parser.add_option(
+        "-a", "--assets-dir",
+        dest="assets_dir",
+        help="Copy images, stylesheets and scripts to DIR under "
+             "content-hashed names, and link them relatively, so that the "
+             "presentation can be published and cached forever",
+        metavar="DIR",
+        default=None
+    )
+
     parser.add_option(
         "-c", "--copy-theme",
         action="store_true",
@@ -58,10 +71,48 @@ def _parse_options():
              "standalone document",
         default=False)
 
+    parser.add_option(
+        "--image-max-size",
+        dest="image_max_size",
+        help="Downscale embedded images to fit in WIDTHxHEIGHT pixels and "
+             "recompress them (requires Pillow)",
+        metavar="WIDTHxHEIGHT",
+        default=None
+    )
+
+    parser.add_option(
+        "--image-quality",
+        type="int",
+        dest="image_quality",
+        help="Quality of the recompressed JPEG and WebP images, from 1 to 95 "
+             "(default: 85)",
+        metavar="QUALITY",
+        default=85
+    )
+
+    parser.add_option(
+        "-j", "--jobs",
+        type="int",
+        dest="jobs",
+        help="Number of processes parsing source files in parallel "
+             "(default: 1), or building decks in parallel in batch mode "
+             "(default: number of CPUs)",
+        metavar="N",
+        default=None)
+
+    parser.add_option(
+        "--lazy-images",
+        action="store_true",
+        dest="lazy_images",
+        help="Decode the images of embedded presentations only as their "
+             "slides come near, so that large presentations open faster",
+        default=False
+    )
+
     parser.add_option(
         "-l", "--linenos",
         type="choice",
-        choices=generator.VALID_LINENOS,
+        choices=highlight.VALID_LINENOS,
         dest="linenos",
         help="How to output linenos in source code. Three options availables: "
         "no (no line numbers); "
@@ -70,6 +121,15 @@ def _parse_options():
         default="inline",
     )
 
+    parser.add_option(
+        "--minify",
+        action="store_true",
+        dest="minify",
+        help="Minify the embedded or bundled stylesheets and scripts, and "
+             "collapse the whitespace of the generated HTML",
+        default=False
+    )
+
     parser.add_option(
         "-o", "--direct-output",
         action="store_true",
@@ -85,6 +145,14 @@ def _parse_options():
         help="Don't include presenter notes in the output",
         default=True)
 
+    parser.add_option(
+        "-p", "--profile",
+        dest="profile",
+        help="Record a timeline of the build to FILE, in the Chrome trace "
+             "event format read by Perfetto and about://tracing",
+        metavar="FILE",
+        default=None)
+
     parser.add_option(
         "-q", "--quiet",
         action="store_false",
@@ -102,6 +170,28 @@ def _parse_options():
         default=False,
     )
 
+    parser.add_option(
+        "-s", "--split-sources",
+        action="store_true",
+        dest="split_sources",
+        help="Split source files into slides before parsing them, so that "
+             "only the edited slides are parsed again; link references, "
+             "footnotes and RST substitutions must then be defined in the "
+             "slide using them",
+        default=False,
+    )
+
+    parser.add_option(
+        "--split-output",
+        type="choice",
+        choices=["slide", "source"],
+        dest="split_output",
+        help="Write a light presentation page loading the slides on demand "
+             "from fragment files, one per slide or per source file",
+        metavar="slide|source",
+        default=None
+    )
+
     parser.add_option(
         "-t", "--theme",
         dest="theme",
@@ -130,6 +220,33 @@ def _parse_options():
         default=False
     )
 
+    parser.add_option(
+        "--debounce",
+        type="float",
+        dest="debounce",
+        help="Seconds to wait for changes to settle before regenerating "
+             "slides in watch mode (default: 0.2)",
+        metavar="SECONDS",
+        default=0.2
+    )
+
+    parser.add_option(
+        "--serve",
+        action="store_true",
+        dest="serve",
+        help="Serve the presentation on localhost, rendered in memory, and "
+             "reload it in the browser when source files change",
+        default=False
+    )
+
+    parser.add_option(
+        "--port",
+        type="int",
+        dest="port",
+        help="Port of the --serve preview server (default: 8000)",
+        default=8000
+    )
+
     parser.add_option(
         "-m", "--math-output",
         action="store_true",
@@ -138,13 +255,31 @@ def _parse_options():
         default=False
     )
 
+    parser.add_option(
+        "--no-cache",
+        action="store_false",
+        dest="cache",
+        help="Don't use the persistent caches of parsed source files and "
+             "highlighted code",
+        default=True
+    )
+
+    parser.add_option(
+        "--clear-cache",
+        action="store_true",
+        dest="clear_cache",
+        help="Empty the persistent caches of parsed source files and "
+             "highlighted code before generating the presentation",
+        default=False
+    )
+
     (options, args) = parser.parse_args()
 
     if not args:
         parser.print_help()
         sys.exit(1)
 
-    return options, args[0]
+    return options, args
 
 
 def log(message, type):
@@ -153,26 +288,60 @@ def log(message, type):
     (sys.stdout if type == 'notice' else sys.stderr).write(message + "\n")
 
 
-def run(input_file, options):
-    """Runs the Generator using parsed options."""
+def expand_inputs(inputs):
+    """Expands the glob patterns of the input files"""
+
+    input_files = []
+    for pattern in inputs:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        input_files.extend(matches or [pattern])
+    return input_files
+
+
+def run(input_files, options):
+    """Runs the Generator using parsed options, or a batch build when given
+       several configuration files. Other inputs than configuration files
+       are built one at a time, so only the first one is built. Returns the
+       exit status."""
 
     options.logger = log
-    generator.Generator(input_file, **options.__dict__).execute()
+
+    if len(input_files) == 1 or not all(input_file.endswith('.cfg')
+                                        for input_file in input_files):
+        from . import generator
+
+        if len(input_files) > 1:
+            log(u"Building %s only, batch builds take configuration files: "
+                "ignoring %s" % (input_files[0], u", ".join(input_files[1:])),
+                'warning')
+        generator.Generator(input_files[0], **options.__dict__).execute()
+        return 0
+
+    from . import batch
+
+    start = time.perf_counter()
+    options = options.__dict__.copy()
+    results = batch.build_decks(input_files, options.pop('jobs'), **options)
+    for line in batch.format_summary(results, time.perf_counter() - start):
+        sys.stdout.write(line + "\n")
+    return 0 if all(result['status'] == 'ok' for result in results) else 1
 
 
 def main():
     """Main program entry point"""
 
-    options, input_file = _parse_options()
+    options, inputs = _parse_options()
+    input_files = expand_inputs(inputs)
 
     if (options.debug):
-        run(input_file, options)
+        sys.exit(run(input_files, options))
     else:
         try:
-            run(input_file, options)
+            status = run(input_files, options)
         except Exception as e:
             sys.stderr.write("Error: %s\n" % e)
             sys.exit(1)
+        sys.exit(status)
 
 
 if __name__ == '__main__':
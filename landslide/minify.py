@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+CSS_TOKEN_RE = re.compile(
+    r'(?P<string>"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')'
+    r'|(?P<comment>/\*.*?\*/)'
+    r'|(?P<space>\s+)'
+    r'|(?P<text>[^"\'/\s]+|.)', re.DOTALL)
+
+# Characters the spaces around which don't matter in stylesheets
+CSS_PUNCTUATION = u'{};,>'
+
+JS_STRING_RE = re.compile(
+    r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`',
+    re.DOTALL)
+JS_COMMENT_RE = re.compile(r'/\*.*?\*/|//[^\n]*', re.DOTALL)
+JS_REGEX_RE = re.compile(
+    r'/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*')
+JS_SPACE_RE = re.compile(r'\s+')
+JS_WORD_RE = re.compile(r'[\w$]+')
+
+# Keywords after which a slash starts a regular expression, not a division
+JS_REGEX_KEYWORDS = frozenset(['case', 'delete', 'do', 'else', 'in',
+                               'instanceof', 'new', 'return', 'throw',
+                               'typeof', 'void'])
+
+HTML_PROTECTED_RE = re.compile(
+    r'<(pre|code|textarea|script|style)\b.*?</\1\s*>|<!--\[if.*?-->',
+    re.DOTALL | re.IGNORECASE)
+HTML_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+HTML_ATTRIBUTE_VALUE_RE = re.compile(r'=\s*(?:"[^"]*"|\'[^\']*\')')
+HTML_TAG_RE = re.compile(
+    r'<[a-zA-Z/][^>"\']*(?:=\s*(?:"[^"]*"|\'[^\']*\')[^>"\']*)*>')
+HTML_SPACE_RE = re.compile(r'\s+')
+
+
+def _is_word_char(char):
+    return char.isalnum() or char in u'_$\\'
+
+
+def _map_matches(regex, text, outside, inside=None):
+    """ Returns ``text`` with the ``outside`` function applied to the parts
+        not matched by ``regex``, and ``inside`` to the matches, which are
+        kept as they are by default.
+    """
+    pieces = []
+    position = 0
+    for match in regex.finditer(text):
+        pieces.append(outside(text[position:match.start()]))
+        pieces.append(inside(match.group()) if inside else match.group())
+        position = match.end()
+    pieces.append(outside(text[position:]))
+    return u''.join(pieces)
+
+
+def _collapse_spaces(text):
+    return HTML_SPACE_RE.sub(
+        lambda match: u'\n' if u'\n' in match.group() else u' ', text)
+
+
+def minify_css(css):
+    """ Removes the comments and the insignificant whitespace of a
+        stylesheet.
+    """
+    output = []
+    space = False
+    for match in CSS_TOKEN_RE.finditer(css):
+        if match.lastgroup in ('space', 'comment'):
+            space = True
+            continue
+        token = match.group()
+        if match.lastgroup == 'text':
+            token = token.replace(u';}', u'}')
+        if output:
+            if token[0] == u'}' and output[-1][-1] == u';':
+                output[-1] = output[-1][:-1]
+            elif space and output[-1][-1] not in CSS_PUNCTUATION and \
+                    token[0] not in CSS_PUNCTUATION:
+                output.append(u' ')
+        output.append(token)
+        space = False
+    return u''.join(output)
+
+
+def minify_js(js):
+    """ Removes the comments and the insignificant whitespace of a script.
+        Line breaks are kept, as statements may rely on them to end.
+    """
+    output = []
+    last = None
+    space = newline = False
+    position = 0
+    while position < len(js):
+        char = js[position]
+        match = None
+        if char in u'"\'`':
+            match = JS_STRING_RE.match(js, position)
+        elif char == u'/':
+            match = JS_COMMENT_RE.match(js, position)
+            if match:
+                newline = newline or u'\n' in match.group()
+                space = True
+                position = match.end()
+                continue
+            # a slash after a value is a division
+            if last is None or (last[-1] not in u')]}"\'`' and not (
+                    _is_word_char(last[-1]) and
+                    last not in JS_REGEX_KEYWORDS)):
+                match = JS_REGEX_RE.match(js, position)
+        elif char.isspace():
+            match = JS_SPACE_RE.match(js, position)
+            newline = newline or u'\n' in match.group()
+            space = True
+            position = match.end()
+            continue
+        elif _is_word_char(char):
+            match = JS_WORD_RE.match(js, position)
+
+        token = match.group() if match else char
+        position += len(token)
+        if output:
+            if newline:
+                output.append(u'\n')
+            elif space and (
+                    (_is_word_char(last[-1]) and _is_word_char(token[0])) or
+                    (last[-1] in u'+-' and token[0] == last[-1]) or
+                    (last[-1] == u'/' and token[0] in u'/*')):
+                output.append(u' ')
+        output.append(token)
+        last = token
+        space = newline = False
+    return u''.join(output)
+
+
+def minify_html(html):
+    """ Removes the comments of an html document and collapses its
+        whitespace, except in quoted attribute values and in the elements
+        where whitespace matters or which hold scripts and stylesheets.
+    """
+    def collapse_tag(tag):
+        return _map_matches(HTML_ATTRIBUTE_VALUE_RE, tag, _collapse_spaces)
+
+    def collapse(text):
+        text = HTML_COMMENT_RE.sub(u'', text)
+        return _map_matches(HTML_TAG_RE, text, _collapse_spaces, collapse_tag)
+
+    return _map_matches(HTML_PROTECTED_RE, html, collapse)
@@ -8,6 +8,13 @@ SUPPORTED_FORMATS = {
     'textile': ['.textile'],
 }
 
+# Libraries whose versions change the HTML of each format
+FORMAT_LIBRARIES = {
+    'markdown': ('markdown', 'pygments'),
+    'restructuredtext': ('docutils', 'pygments'),
+    'textile': ('textile',),
+}
+
 
 class Parser(object):
     """This class generates the HTML code depending on which syntax is used in
@@ -28,10 +35,24 @@ class Parser(object):
 
     md_extensions = ''
 
-    def __init__(self, extension, encoding='utf8', md_extensions=''):
-        """Configures this parser.
+    MD_SEPARATOR_RE = re.compile(r'^ {0,3}([-*_])(?: {0,2}\1){2,} *$')
+    MD_FENCE_RE = re.compile(r'^ {0,3}(```|~~~)')
+    RST_TRANSITION_RE = re.compile(r'^([!-/:-@\[-`{-~])\1{3,} *$')
+    RST_ADORNMENT_RE = re.compile(r'^([!-/:-@\[-`{-~])\1+ *$')
+    RST_LEVEL_TITLE = u'landslide-section-level-%d'
+    RST_FILE_DIRECTIVE_RE = re.compile(
+        r'^\s*\.\.\s+include::|^\s+:(?:file|url):', re.MULTILINE)
+    RST_LEVEL_TITLE_RE = re.compile(
+        r'<h\d+>landslide-section-level-\d+</h\d+>\s*', re.UNICODE)
+
+    def __init__(self, extension, encoding='utf8', md_extensions='',
+                 highlight_cache=None):
+        """Configures this parser. ``highlight_cache`` is the optional
+           ``cache.FileCache`` of the code highlighted by reStructuredText
+           directives.
         """
         self.encoding = encoding
+        self.highlight_cache = highlight_cache
         self.format = None
 
         for supp_format, supp_extensions in SUPPORTED_FORMATS.items():
@@ -44,10 +65,126 @@ class Parser(object):
 
         if md_extensions:
             exts = (value.strip() for value in md_extensions.split(','))
-            self.md_extensions = filter(None, exts)
+            self.md_extensions = list(filter(None, exts))
 
-    def parse(self, text):
+    def get_versions(self):
+        """Returns the versions of the libraries this parser renders HTML
+           with, the missing ones being left out.
+        """
+        versions = []
+        for name in FORMAT_LIBRARIES[self.format]:
+            try:
+                module = __import__(name)
+            except ImportError:
+                continue
+            versions.append(u"%s %s" % (name,
+                                        getattr(module, '__version__', '')))
+        return u", ".join(versions)
+
+    def reads_files(self, text):
+        """Tells whether parsing ``text`` reads other files, through the
+           ``include`` directive or the ``:file:`` and ``:url:`` options of
+           reStructuredText.
+        """
+        return self.format == 'restructuredtext' and \
+            bool(self.RST_FILE_DIRECTIVE_RE.search(text))
+
+    def split(self, text):
+        """Splits a text into the sources of its slides, at the horizontal
+           rules which are unambiguous before parsing. Rules that can't be
+           told apart from other markup are left in place, so the HTML of
+           each part still has to be split on its ``<hr>`` tags.
+
+           Docutils ranks the section title styles of each part in the order
+           it meets them, so reStructuredText parts start with placeholder
+           titles in the styles of the whole text, which ``parse`` removes.
+        """
+        if self.format == 'textile':
+            return text.split('\n---\n')
+
+        lines = text.split('\n')
+        parts = []
+        current = []
+        fence = None
+        for index, line in enumerate(lines):
+            previous_blank = not current or not current[-1].strip()
+            if self.format == 'markdown':
+                match = self.MD_FENCE_RE.match(line)
+                if match and fence is None:
+                    fence = match.group(1)
+                elif match and match.group(1) == fence:
+                    fence = None
+                is_separator = fence is None and previous_blank and \
+                    self.MD_SEPARATOR_RE.match(line)
+            elif self.format == 'restructuredtext':
+                next_blank = index + 1 == len(lines) or \
+                    not lines[index + 1].strip()
+                is_separator = previous_blank and next_blank and \
+                    self.RST_TRANSITION_RE.match(line)
+            else:
+                is_separator = False
+
+            if is_separator:
+                parts.append(u'\n'.join(current))
+                current = []
+            else:
+                current.append(line)
+        parts.append(u'\n'.join(current))
+
+        if self.format == 'restructuredtext':
+            preamble = self.get_rst_levels_preamble(lines)
+            if preamble:
+                parts = [preamble + part for part in parts]
+
+        return parts
+
+    def get_rst_title_styles(self, lines):
+        """Returns the section title styles of reStructuredText ``lines``,
+           as ``(overline, underline)`` characters, in the order of their
+           levels.
+        """
+        styles = []
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            previous_blank = index == 0 or not lines[index - 1].strip()
+            following = lines[index + 1:index + 3]
+            match = self.RST_ADORNMENT_RE.match(line)
+            if match and previous_blank and len(following) == 2 and \
+                    following[0].strip() and \
+                    following[1].rstrip() == line.rstrip():
+                style = (match.group(1), match.group(1))
+                index += 3
+            elif not match and line.strip() and previous_blank and \
+                    not line[0].isspace() and following and \
+                    self.RST_ADORNMENT_RE.match(following[0]) and \
+                    len(following[0].rstrip()) >= min(4, len(line.rstrip())):
+                style = (None, following[0][0])
+                index += 2
+            else:
+                index += 1
+                continue
+            if style not in styles:
+                styles.append(style)
+        return styles
+
+    def get_rst_levels_preamble(self, lines):
+        """Returns nested placeholder section titles, one in each title
+           style of reStructuredText ``lines``, from the top level down.
+        """
+        preamble = []
+        for level, (overline, underline) in enumerate(
+                self.get_rst_title_styles(lines), 1):
+            title = self.RST_LEVEL_TITLE % level
+            if overline:
+                preamble.append(overline * len(title))
+            preamble.extend([title, underline * len(title), u''])
+        return u'\n'.join(preamble) + u'\n' if preamble else u''
+
+    def parse(self, text, part=False):
         """Parses and renders a text as HTML regarding current format.
+           ``part`` tells that the text is one of the parts returned by
+           ``split``, rather than a whole document.
         """
         if self.format == 'markdown':
             try:
@@ -65,11 +202,16 @@ class Parser(object):
             except ImportError:
                 raise RuntimeError(u"Looks like docutils are not installed")
 
-            html = html_body(text, input_encoding=self.encoding)
+            # a lone section of a part is a slide title, not a document one
+            html = html_body(text, input_encoding=self.encoding,
+                             doctitle=not part,
+                             highlight_cache=self.highlight_cache)
 
             # RST generates pretty much markup to be removed in our case
             for (pattern, replacement, mode) in self.RST_REPLACEMENTS:
                 html = re.sub(re.compile(pattern, mode), replacement, html, 0)
+            if part:
+                html = self.RST_LEVEL_TITLE_RE.sub(u'', html)
 
             return html.strip()
         elif self.format == 'textile':
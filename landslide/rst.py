@@ -3,9 +3,7 @@
 from docutils import core, nodes
 from docutils.parsers.rst import directives, Directive
 
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import get_lexer_by_name, TextLexer
+from . import highlight
 
 
 class Pygments(Directive):
@@ -21,18 +19,22 @@ class Pygments(Directive):
 
     def run(self):
         self.assert_has_content()
+        language = self.arguments[0]
         try:
-            lexer = get_lexer_by_name(self.arguments[0])
+            highlight.get_lexer(language)
         except ValueError:
             # no lexer found - use the text one instead of an exception
-            lexer = TextLexer()
+            language = 'text'
         args = {'noclasses': False}
         if 'linenos' in self.options:
             args['linenos'] = 'table'
         if 'emphasize-lines' in self.options:
             args['hl_lines'] = self.options['emphasize-lines'].split(',')
-        formatter = HtmlFormatter(**args)
-        parsed = highlight(u'\n'.join(self.content), lexer, formatter)
+        settings = self.state.document.settings
+        parsed = highlight.highlight(
+            u'\n'.join(self.content), language,
+            disk_cache=getattr(settings, 'landslide_highlight_cache', None),
+            **args)
         return [nodes.raw('', parsed, format='html')]
 
 
@@ -41,7 +43,8 @@ directives.register_directive('code-block', Pygments)
 
 
 def html_parts(input_string, source_path=None, destination_path=None,
-               input_encoding='unicode', doctitle=1, initial_header_level=1):
+               input_encoding='unicode', doctitle=1, initial_header_level=1,
+               highlight_cache=None):
     """
     Given an input string, returns a dictionary of HTML document parts.
 
@@ -64,12 +67,15 @@ def html_parts(input_string, source_path=None, destination_path=None,
       promotion); enabled by default.
     - `initial_header_level`: The initial level for header elements (e.g. 1
       for "<h1>").
+    - `highlight_cache`: The `cache.FileCache` persisting the code blocks
+      highlighted by the `sourcecode` directive; optional.
     """
     overrides = {
         'input_encoding': input_encoding,
         'doctitle_xform': doctitle,
         'initial_header_level': initial_header_level,
-        'report_level': 5
+        'report_level': 5,
+        'landslide_highlight_cache': highlight_cache,
     }
 
     parts = core.publish_parts(
@@ -80,7 +86,8 @@ def html_parts(input_string, source_path=None, destination_path=None,
 
 
 def html_body(input_string, source_path=None, destination_path=None,
-              input_encoding='unicode', doctitle=1, initial_header_level=1):
+              input_encoding='unicode', doctitle=1, initial_header_level=1,
+              highlight_cache=None):
     """
     Given an input string, returns an HTML fragment as a string.
 
@@ -95,6 +102,7 @@ def html_body(input_string, source_path=None, destination_path=None,
         input_string=input_string, source_path=source_path,
         destination_path=destination_path,
         input_encoding=input_encoding, doctitle=doctitle,
-        initial_header_level=initial_header_level)
+        initial_header_level=initial_header_level,
+        highlight_cache=highlight_cache)
     fragment = parts['html_body']
     return fragment
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import threading
+
+
+class BuildCancelled(Exception):
+    """Raised by a build noticing it was made obsolete by newer changes"""
+    pass
+
+
+class BuildScheduler(object):
+    """Coalesces change notifications and runs builds on a worker thread.
+
+       Changes reported within ``debounce`` seconds of each other trigger a
+       single build. A change reported while a build is running flags that
+       build as cancelled; the build function is passed an ``is_cancelled``
+       callable to poll, and may raise ``BuildCancelled`` to give up early.
+    """
+
+    def __init__(self, build_func, debounce=0.2):
+        self.build_func = build_func
+        self.debounce = debounce
+        self.pending = set()
+        self.last_change = 0
+        self.stopped = False
+        self.cancel_event = threading.Event()
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.cancel_event.set()
+            self.condition.notify()
+        self.thread.join()
+
+    def schedule(self, paths):
+        """Queues a build for the changed ``paths``"""
+        with self.condition:
+            self.pending.update(paths)
+            self.last_change = time.time()
+            self.cancel_event.set()
+            self.condition.notify()
+
+    def wait_for_changes(self):
+        """Blocks until changes settled for the debounce window, and returns
+           them, or ``None`` once stopped."""
+        with self.condition:
+            while not self.pending and not self.stopped:
+                self.condition.wait()
+            while not self.stopped:
+                remaining = self.last_change + self.debounce - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            if self.stopped:
+                return None
+            paths, self.pending = self.pending, set()
+            self.cancel_event = threading.Event()
+            return paths
+
+    def run(self):
+        while True:
+            paths = self.wait_for_changes()
+            if paths is None:
+                return
+            try:
+                self.build_func(sorted(paths), self.cancel_event.is_set)
+            except BuildCancelled:
+                with self.condition:
+                    self.pending.update(paths)
+            except Exception as e:
+                sys.stderr.write("Error: %s\n" % e)
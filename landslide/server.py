@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+RELOAD_SCRIPT = u"""<script>
+(function () {
+  var events = new EventSource('/events?build=%d');
+  var reload = function () {
+    events.close();
+    window.location.reload();
+  };
+  events.addEventListener('reload', reload);
+  events.addEventListener('patch', function (event) {
+    if (!window.patchSlides || !window.patchSlides(JSON.parse(event.data))) {
+      reload();
+    }
+  });
+})();
+</script>
+"""
+IMAGE_KEY_RE = re.compile(r'\sdata-image="([^"]+)"')
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    """Serves the presentation, and the stream of its rebuild events"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path in ('/', '/index.html'):
+            self.send_presentation()
+        elif url.path == '/events':
+            # reconnecting pages tell the last build they were patched to
+            build_id = self.headers.get('Last-Event-ID') or \
+                parse_qs(url.query).get('build', [''])[0]
+            self.send_events(int(build_id) if build_id.isdigit() else None)
+        else:
+            self.send_error(404)
+
+    def send_presentation(self):
+        html = self.server.get_presentation()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(html)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(html)
+
+    def send_events(self, build_id):
+        """Streams a ``patch`` server-sent event after each rebuild changing
+           only slides, a ``reload`` one after other rebuilds, and right away
+           if the page comes from an older build"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+
+        if build_id is None:
+            build_id = self.server.build_id
+        try:
+            while True:
+                new_build_id = self.server.wait_for_build(build_id)
+                if self.server.closing:
+                    break
+                if new_build_id != build_id:
+                    patch = None
+                    if new_build_id == build_id + 1:
+                        patch = self.server.get_patch(new_build_id)
+                    build_id = new_build_id
+                    if patch:
+                        self.wfile.write(b'event: patch\nid: %d\ndata: %s\n\n'
+                                         % (build_id, patch))
+                    else:
+                        self.wfile.write(b'event: reload\ndata: %d\n\n'
+                                         % build_id)
+                else:
+                    self.wfile.write(b': keep-alive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """Serves a presentation rendered in memory on localhost, and sends the
+       open pages the slides which changed once it is rebuilt, or tells them
+       to reload when more than slides changed"""
+
+    daemon_threads = True
+
+    keep_alive = 15
+
+    def __init__(self, generator, port=8000, host='127.0.0.1'):
+        ThreadingHTTPServer.__init__(self, (host, port), PreviewRequestHandler)
+        self.generator = generator
+        self.html = b''
+        self.build_id = 0
+        self.patch = None
+        self.shell = None
+        self.fingerprints = None
+        self.toc = None
+        self.image_table = None
+        self.closing = False
+        self.condition = threading.Condition()
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % self.server_address[:2]
+
+    def build(self, changed_paths=None, is_cancelled=None):
+        """Renders the presentation again, parsing only the changed files,
+           and notifies the open pages"""
+        html, context = self.generator.render_changes(changed_paths,
+                                                      is_cancelled)
+        patch = self.make_patch(context)
+
+        with self.condition:
+            self.build_id += 1
+            html = inject_reload_script(html, self.build_id)
+            self.html = html.encode('utf_8')
+            self.patch = None
+            if patch is not None:
+                self.patch = (self.build_id,
+                              json.dumps(patch).encode('utf_8'))
+            self.condition.notify_all()
+
+        if patch is None:
+            self.generator.log(u"Rendered build %d" % self.build_id)
+        else:
+            self.generator.log(u"Rendered build %d, patching %d slides"
+                               % (self.build_id, len(patch['slides'])))
+
+    def make_patch(self, context):
+        """Returns the slides and table of contents which changed since the
+           previous build, rendered with the theme partials, or ``None`` when
+           the pages have to reload"""
+        template = self.generator.get_template()
+        theme_dir = os.path.dirname(template.filename)
+        if not os.path.exists(os.path.join(theme_dir, 'slide.html')):
+            # themes with their own slides markup can't be patched
+            return None
+
+        environment = template.environment
+        slide_template = environment.get_template('slide.html')
+        toc_template = environment.get_template('toc.html')
+
+        # anything rendered around the slides needs a reload, as does a
+        # changed template or number of slides
+        shell = (template, slide_template, toc_template, json.dumps(
+            [context[name] for name in ('head_title', 'num_slides', 'css',
+                                        'js', 'user_css', 'user_js',
+                                        'math_output', 'embed')],
+            sort_keys=True))
+        fingerprints = [slide['fingerprint'] if slide else None
+                        for slide in context['slides']]
+        toc = toc_template.render(context)
+
+        image_table = context.get('image_table') or {}
+
+        previous_shell, previous_fingerprints, previous_toc, previous_table = \
+            self.shell, self.fingerprints, self.toc, self.image_table
+        self.shell, self.fingerprints, self.toc, self.image_table = \
+            shell, fingerprints, toc, image_table
+        if shell != previous_shell or \
+                len(fingerprints) != len(previous_fingerprints):
+            return None
+
+        # slides not hydrated yet keep the image keys of the previous build
+        if any(previous_table[key] != url for key, url in image_table.items()
+               if key in previous_table):
+            return None
+
+        slides = []
+        images = {}
+        for index, slide in enumerate(context['slides']):
+            if fingerprints[index] == previous_fingerprints[index]:
+                continue
+            html = slide_template.render(dict(context, slide=slide))
+            for key in IMAGE_KEY_RE.findall(html):
+                if key in image_table:
+                    images[key] = image_table[key]
+            slides.append({'index': index, 'html': html})
+
+        return {'count': len(fingerprints), 'slides': slides,
+                'toc': toc if toc != previous_toc else None, 'images': images}
+
+    def get_presentation(self):
+        """Returns the encoded html of the latest build"""
+        with self.condition:
+            return self.html
+
+    def get_patch(self, build_id):
+        """Returns the encoded patch turning the pages of the previous build
+           into ``build_id``, or ``None`` if they have to reload"""
+        with self.condition:
+            if self.patch and self.patch[0] == build_id:
+                return self.patch[1]
+
+    def wait_for_build(self, build_id, timeout=None):
+        """Waits for a build newer than ``build_id`` and returns its number,
+           or the current one after the keep-alive delay or on closing"""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.build_id != build_id or self.closing,
+                self.keep_alive if timeout is None else timeout)
+            return self.build_id
+
+    def close(self):
+        """Ends the event streams and stops serving"""
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.shutdown()
+        self.server_close()
+
+
+def inject_reload_script(html, build_id):
+    """Adds the live reload script at the end of the html body"""
+
+    script = RELOAD_SCRIPT % build_id
+    position = html.rfind(u'</body>')
+    if position == -1:
+        return html + script
+    return html[:position] + script + html[position:]
+
+
+def serve(generator, port=8000, debounce=0.2):
+    """Serves the presentation of ``generator`` on localhost until
+       interrupted, rebuilding it when its source files change"""
+
+    from landslide.watcher import watch
+
+    server = PreviewServer(generator, port)
+    server.build()
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    generator.log(u"Serving  %s" % server.url)
+
+    ignore = []
+    if generator.profile:
+        ignore.append(generator.profile)
+    try:
+        watch(generator.watch_dir, server.build, ignore=ignore,
+              debounce=debounce)
+    finally:
+        server.close()
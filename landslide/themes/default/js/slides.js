@@ -20,6 +20,10 @@ function main() {
     var showingPresenterView = false;
     var presenterViewWin = null;
     var isPresenterView = false;
+    var imageTable = null;
+    var fragmentRequests = {};
+    var FRAGMENT_PREFETCH = 2;
+    var IMAGE_PREFETCH = 2;
 
     var str2array = function(s) {
         if (typeof s == 'string' || s instanceof String) {
@@ -110,6 +114,9 @@ function main() {
     var updateSlideClasses = function(updateOther) {
         window.location.hash = (isPresenterView ? "presenter" : "slide") + currentSlideNo;
 
+        loadSlideFragments();
+        hydrateSlideImages();
+
         for (var i=1; i<currentSlideNo-1; i++) {
             changeSlideElClass(i, 'far-past');
         }
@@ -136,8 +143,12 @@ function main() {
     var updatePresenterNotes = function() {
         if (!isPresenterView) { return; }
 
+        // slides of split outputs have no notes until their fragment loads
+        var slideNote = getSlidePresenterNote(currentSlideNo);
+        if (!slideNote) { return; }
+
         var existingNote = document.getElementById('current_presenter_notes');
-        var currentNote = getSlidePresenterNote(currentSlideNo).cloneNode(true);
+        var currentNote = slideNote.cloneNode(true);
         currentNote.setAttribute('id', 'presenter_note');
 
         existingNote.replaceChild(currentNote, document.getElementById('presenter_note'));
@@ -255,6 +266,7 @@ function main() {
 
     var toggleOverview = function() {
         if (!overviewActive) {
+            hydrateImages(document);
             addClass(document.body, 'expose');
             overviewActive = true;
             setScale(1);
@@ -485,19 +497,22 @@ function main() {
         }
     };
 
+    var addSlideClickListener = function(slide, num) {
+        slide.num = num;
+        slide.addEventListener('click', function(e) {
+            if (overviewActive) {
+                currentSlideNo = this.num;
+                toggleOverview();
+                updateSlideClasses(true);
+                e.preventDefault();
+            }
+            return false;
+        }, true);
+    };
+
     var addSlideClickListeners = function() {
         for (var i=0; i < slides.length; i++) {
-            var slide = slides.item(i);
-            slide.num = i + 1;
-            slide.addEventListener('click', function(e) {
-                if (overviewActive) {
-                    currentSlideNo = this.num;
-                    toggleOverview();
-                    updateSlideClasses(true);
-                    e.preventDefault();
-                }
-                return false;
-            }, true);
+            addSlideClickListener(slides.item(i), i + 1);
         }
     };
 
@@ -526,6 +541,34 @@ function main() {
         }, false);
     };
 
+    var loadImageTable = function() {
+        var table = document.getElementById('image_table');
+        if (table) {
+            imageTable = JSON.parse(table.textContent);
+        }
+    };
+
+    var hydrateImages = function(root) {
+        if (!imageTable) { return; }
+
+        var images = root.querySelectorAll('img[data-image]');
+        for (var i = 0; i < images.length; i++) {
+            var key = images[i].getAttribute('data-image');
+            images[i].removeAttribute('data-image');
+            images[i].src = imageTable[key];
+        }
+    };
+
+    // Images of the image table are only decoded once their slide comes near
+    var hydrateSlideImages = function() {
+        for (var i = currentSlideNo - IMAGE_PREFETCH; i <= currentSlideNo + IMAGE_PREFETCH; i++) {
+            var el = getSlideEl(i);
+            if (el) {
+                hydrateImages(el);
+            }
+        }
+    };
+
     var addTocLinksListeners = function() {
         var toc = document.getElementById('toc');
         if (toc) {
@@ -540,6 +583,80 @@ function main() {
         }
     };
 
+    var parseFragment = function(html, selector) {
+        var container = document.createElement('div');
+        container.innerHTML = html;
+        return container.querySelector(selector);
+    };
+
+    // Loads the fragments of the current slide and of its neighbours in split
+    // outputs, as scripts so that they load from local files too
+    var loadSlideFragments = function() {
+        for (var i = currentSlideNo - FRAGMENT_PREFETCH; i <= currentSlideNo + FRAGMENT_PREFETCH; i++) {
+            var el = getSlideEl(i);
+            var url = el && el.parentNode.getAttribute('data-fragment');
+            if (url && !fragmentRequests[url]) {
+                fragmentRequests[url] = true;
+                var script = document.createElement('script');
+                script.src = url;
+                document.body.appendChild(script);
+            }
+        }
+    };
+
+    // Replaces the placeholders of the slides a fragment script holds
+    var addSlideFragment = function(html) {
+        var container = document.createElement('div');
+        container.innerHTML = html;
+        var wrappers = container.querySelectorAll('.slide-wrapper');
+        for (var i = 0; i < wrappers.length; i++) {
+            var slide = wrappers[i].getElementsByClassName('slide')[0];
+            var num = Number(/(^|\s)slide-(\d+)(\s|$)/.exec(slide.className)[2]);
+            var placeholder = getSlideEl(num).parentNode;
+            hydrateImages(wrappers[i]);
+            addClass(slide, 'slide far-future');
+            addSlideClickListener(slide, num);
+            placeholder.parentNode.replaceChild(wrappers[i], placeholder);
+        }
+        updateSlideClasses(false);
+    };
+
+    // Replaces the slides and table of contents changed by a live preview
+    // rebuild, returns false when the page has to reload instead
+    var patchSlides = function(patch) {
+        var container = document.getElementsByClassName('slides')[0];
+        if (!container) { return false; }
+        var wrappers = container.querySelectorAll('.slides > .slide-wrapper[data-fingerprint]');
+        if (wrappers.length != patch.count) { return false; }
+
+        for (var key in patch.images) {
+            imageTable = imageTable || {};
+            imageTable[key] = patch.images[key];
+        }
+
+        for (var i = 0; i < patch.slides.length; i++) {
+            var index = patch.slides[i].index;
+            var wrapper = parseFragment(patch.slides[i].html, '.slide-wrapper');
+            var slide = wrapper.getElementsByClassName('slide')[0];
+            hydrateImages(wrapper);
+            addClass(slide, 'slide far-future');
+            addSlideClickListener(slide, index + 1);
+            container.replaceChild(wrapper, wrappers[index]);
+        }
+
+        var toc = document.getElementById('toc');
+        if (patch.toc && toc) {
+            var newToc = parseFragment(patch.toc, '#toc');
+            newToc.className = toc.className;
+            newToc.style.cssText = toc.style.cssText;
+            toc.parentNode.replaceChild(newToc, toc);
+            addTocLinksListeners();
+        }
+
+        updateSlideClasses(false);
+        return true;
+    };
+
     // initialize
 
     (function() {
@@ -563,6 +680,11 @@ function main() {
         document.onmousewheel = handleWheel;
         window.onresize = expandSlides;
 
+        loadImageTable();
+        window.addEventListener('beforeprint', function() {
+            hydrateImages(document);
+        }, false);
+
         for (var i = 0, el; el = slides[i]; i++) {
             addClass(el, 'slide far-future');
         }
@@ -576,5 +698,8 @@ function main() {
         addSlideClickListeners();
 
         addRemoteWindowControls();
+
+        window.patchSlides = patchSlides;
+        window.addSlideFragment = addSlideFragment;
     })();
 }
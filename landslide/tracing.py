@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import threading
+
+
+class NullSpan(object):
+    """ Context manager doing nothing, returned by ``NullTracer.span``.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullTracer(object):
+    """ Tracer used when profiling is disabled: spans cost a method call.
+    """
+    enabled = False
+
+    _span = NullSpan()
+
+    def span(self, name, category='build', **args):
+        return self._span
+
+    def add_events(self, events):
+        pass
+
+    def flush(self):
+        return []
+
+
+class Span(object):
+    """ Times a block of code as a complete event of a ``Tracer``.
+    """
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        self.tracer.events.append({
+            'name': self.name, 'cat': self.category, 'ph': 'X',
+            'ts': self.start * 1e6, 'dur': (end - self.start) * 1e6,
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            'args': self.args,
+        })
+        return False
+
+
+class Tracer(object):
+    """ Records timed spans of a build as Chrome trace events, which open in
+        Perfetto or about://tracing once written with ``write``.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+
+    def __getstate__(self):
+        # parsing processes record their own events
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def span(self, name, category='build', **args):
+        return Span(self, name, category, args)
+
+    def add_events(self, events):
+        """ Adds events recorded by another tracer, in a parsing process.
+        """
+        self.events.extend(events)
+
+    def flush(self):
+        """ Returns the recorded events and forgets them.
+        """
+        events, self.events = self.events, []
+        return events
+
+    def write(self, path):
+        """ Writes the events recorded since the last write to ``path`` as
+            trace event JSON, and forgets them.
+        """
+        events = self.flush()
+        metadata = [{
+            'name': 'process_name', 'ph': 'M', 'pid': pid,
+            'args': {'name': 'landslide' if pid == self.pid
+                     else 'landslide parser %d' % pid},
+        } for pid in sorted(set(event['pid'] for event in events))]
+
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': metadata + events,
+                       'displayTimeUnit': 'ms'}, trace_file)
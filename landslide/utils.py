@@ -2,8 +2,65 @@
 
 import os
 import base64
+import hashlib
+import tempfile
 import mimetypes
 
+from collections import OrderedDict
+
+
+# Suffix of the temporary files outputs are written to before replacing them
+TEMP_SUFFIX = '.landslide-tmp'
+
+
+def _get_default_file_mode():
+    # the umask can only be read by setting it, which affects every thread,
+    # so it's read once on import
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Mode of the files created by ``open``, which new outputs are given
+DEFAULT_FILE_MODE = _get_default_file_mode()
+
+# Characters of data URIs kept in memory for the images encoded last
+ENCODED_IMAGES_MAX_SIZE = 64 * 1024 * 1024
+
+
+class _EncodedImages(OrderedDict):
+    """ Encoded images by real path and processing settings, along with the
+        (mtime, size) they were read at. The least recently used ones are
+        dropped once their data URIs grow over ``max_size`` characters.
+    """
+    def __init__(self, max_size):
+        OrderedDict.__init__(self)
+        self.max_size = max_size
+        self.size = 0
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.size -= len(self[key][1])
+        OrderedDict.__setitem__(self, key, value)
+        self.move_to_end(key)
+        self.size += len(value[1])
+        while self.size > self.max_size and len(self) > 1:
+            _, (_, encoded_url) = self.popitem(last=False)
+            self.size -= len(encoded_url)
+
+    def clear(self):
+        OrderedDict.clear(self)
+        self.size = 0
+
+
+_encoded_images = _EncodedImages(ENCODED_IMAGES_MAX_SIZE)
+
 
 def get_path_url(path, relative=False):
     """ Returns an absolute or relative path url given a path
@@ -14,7 +71,7 @@ def get_path_url(path, relative=False):
         return 'file://%s' % os.path.abspath(path)
 
 
-def encode_image_from_url(url, source_path):
+def encode_image_from_url(url, source_path, processor=None):
     if not url or url.startswith('data:') or url.startswith('file://'):
         return False
 
@@ -35,11 +92,96 @@ def encode_image_from_url(url, source_path):
 
         return False
 
+    try:
+        stat = os.stat(real_path)
+    except OSError:
+        return False
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (os.path.abspath(real_path), processor.key if processor else None)
+    cached = _encoded_images.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+
     try:
         with open(real_path, 'rb') as image_file:
             image_contents = image_file.read()
-            encoded_image = base64.b64encode(image_contents)
     except IOError:
         return False
 
-    return u"data:%s;base64,%s" % (mime_type, encoded_image.decode())
+    if processor:
+        image_contents = processor.process(real_path, image_contents,
+                                           mime_type)
+    encoded_image = base64.b64encode(image_contents)
+
+    encoded_url = u"data:%s;base64,%s" % (mime_type, encoded_image.decode())
+    _encoded_images[key] = (signature, encoded_url)
+
+    return encoded_url
+
+
+def make_temp_file(path):
+    """ Creates a temporary file next to ``path``, so that it can be renamed
+        over it, and returns its file descriptor and path.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    return tempfile.mkstemp(dir=directory, prefix='.%s.' % name,
+                            suffix=TEMP_SUFFIX)
+
+
+def file_digest(path):
+    """ Returns the SHA-1 hex digest of a file's contents, or ``None`` if it
+        can't be read.
+    """
+    digest = hashlib.sha1()
+    try:
+        with open(path, 'rb') as read_file:
+            for block in iter(lambda: read_file.read(1 << 16), b''):
+                digest.update(block)
+    except (IOError, OSError):
+        return None
+    return digest.hexdigest()
+
+
+def replace_if_changed(tmp_path, path, digest=None):
+    """ Renames ``tmp_path`` over ``path``, unless both files have the same
+        contents, in which case ``tmp_path`` is removed and ``path`` is left
+        untouched. ``digest`` is the digest of ``tmp_path``, when known.
+        Returns whether ``path`` changed.
+    """
+    try:
+        same_size = os.path.getsize(tmp_path) == os.path.getsize(path)
+    except OSError:
+        same_size = False
+
+    if same_size and (digest or file_digest(tmp_path)) == file_digest(path):
+        os.remove(tmp_path)
+        return False
+
+    # temporary files are only readable by their owner
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = DEFAULT_FILE_MODE
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+    return True
+
+
+def write_if_changed(path, chunks):
+    """ Writes the ``chunks`` of bytes to ``path`` through a temporary file
+        renamed over it, so that readers never see a partial file, unless
+        ``path`` already holds the same contents. Returns whether ``path``
+        changed.
+    """
+    digest = hashlib.sha1()
+    fd, tmp_path = make_temp_file(path)
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            for chunk in chunks:
+                digest.update(chunk)
+                tmp_file.write(chunk)
+        return replace_if_changed(tmp_path, path, digest.hexdigest())
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
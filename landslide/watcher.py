@@ -1,20 +1,26 @@
+import os
 import sys
 import time
 
+from landslide.scheduler import BuildScheduler
+from landslide.utils import TEMP_SUFFIX
+
 try:
     from watchdog.observers import Observer
-    from watchdog.events import FileSystemEventHandler, DirModifiedEvent
+    from watchdog.events import FileSystemEventHandler
 except ImportError:
     print('Error: The watchdog module must be installed to use the -w option')
     print('Exiting...')
     sys.exit(1)
 
 
-def watch(watch_dir, generate_func):
-    event_handler = LandslideEventHandler(generate_func)
+def watch(watch_dir, generate_func, ignore=None, debounce=0.2):
+    scheduler = BuildScheduler(generate_func, debounce)
+    event_handler = LandslideEventHandler(scheduler.schedule, ignore)
     observer = Observer()
 
     observer.schedule(event_handler, path=watch_dir, recursive=True)
+    scheduler.start()
     observer.start()
 
     try:
@@ -22,16 +28,36 @@ def watch(watch_dir, generate_func):
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
+        scheduler.stop()
 
     observer.join()
 
 
 class LandslideEventHandler(FileSystemEventHandler):
-    def __init__(self, generate_func):
+    """Calls ``generate_func`` with the paths of the files that changed"""
+
+    def __init__(self, generate_func, ignore=None):
         super(LandslideEventHandler, self).__init__()
 
         self.generate_func = generate_func
-
-    def on_modified(self, event):
-        if isinstance(event, DirModifiedEvent):
-            self.generate_func()
+        self.ignore = set(os.path.abspath(path) for path in ignore or [])
+
+    def get_changed_paths(self, event):
+        if event.is_directory or event.event_type not in ('created', 'deleted',
+                                                          'modified', 'moved'):
+            return []
+
+        paths = [event.src_path]
+        if getattr(event, 'dest_path', None):
+            paths.append(event.dest_path)
+
+        # outputs are written to temporary files first
+        return [os.path.abspath(path) for path in paths
+                if os.path.abspath(path) not in self.ignore and
+                os.path.dirname(os.path.abspath(path)) not in self.ignore and
+                not path.endswith(TEMP_SUFFIX)]
+
+    def on_any_event(self, event):
+        changed_paths = self.get_changed_paths(event)
+        if changed_paths:
+            self.generate_func(changed_paths)
@@ -1,14 +1,32 @@
 # -*- coding: utf-8 -*-
 
-from landslide import macro
+from landslide import (batch, highlight, images, macro, main, minify, server,
+                       utils)
 import os
 import re
 import unittest
+from unittest import mock
 import codecs
+import io
+import json
+import optparse
+import http.client
+import sys
 import base64
+import shutil
+import tempfile
+import threading
+import subprocess
 
-from landslide.generator import Generator
+from landslide.cache import FileCache
+from landslide.generator import Generator, get_environment
 from landslide.parser import Parser
+from landslide.scheduler import BuildCancelled, BuildScheduler
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'test-data')
@@ -18,6 +36,15 @@ if (not os.path.exists(DATA_DIR)):
 
 
 class BaseTestCase(unittest.TestCase):
+    def setUp(self):
+        # builds cache in a directory of their own, not the user one
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        environ = mock.patch.dict(os.environ,
+                                  {'LANDSLIDE_CACHE_DIR': cache_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+
     def logtest(self, message, type='notice'):
         if type == 'warning':
             raise WarningMessage(message)
@@ -38,6 +65,127 @@ class GeneratorTest(BaseTestCase):
         self.assertEqual(g.user_css[0]['contents'], '* {color: red;}')
         self.assertEqual(g.user_js[0]['contents'], "alert('foo');")
 
+    def test_asset_registry(self):
+        css_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, css_dir)
+        css_path = os.path.join(css_dir, 'user.css')
+        with open(css_path, 'w') as css:
+            css.write('h1 {color: red;}')
+
+        messages = []
+        g = Generator(os.path.join(DATA_DIR, 'test.md'), embed=True,
+                      verbose=True, logger=lambda message, type: messages.append(message))
+        g.add_user_css([css_path, css_path])
+        self.assertEqual(len(g.user_css), 1)
+        self.assertTrue(u"Loading  %s" % css_path in messages)
+        self.assertEqual(Generator(os.path.join(DATA_DIR, 'test.md')).user_css,
+                         [])
+
+        g.render()
+        del messages[:]
+        g.render()
+        self.assertFalse(any(message.startswith(u"Loading  ")
+                             for message in messages))
+        self.assertTrue(any(message.startswith(u"Assets   0 loaded, ")
+                            for message in messages))
+
+        with open(css_path, 'w') as css:
+            css.write('h1 {color: blue;}')
+        os.utime(css_path, ns=(0, 0))
+        self.assertTrue('h1 {color: blue;}' in g.render())
+
+    def test_embed_theme_images(self):
+        css_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, css_dir)
+        shutil.copy(os.path.join(DATA_DIR, 'img.png'),
+                    os.path.join(css_dir, 'pic.png'))
+        css_path = os.path.join(css_dir, 'user.css')
+        with open(css_path, 'w') as css:
+            css.write('h1 {background: url("pic.png");} '
+                      'h2 {background: url(pic.png);}')
+        with open(os.path.join(css_dir, 'slides.md'), 'w') as slides:
+            slides.write('# Title\n\n`url(pic.png)`\n')
+
+        g = Generator(os.path.join(css_dir, 'slides.md'), embed=True,
+                      theme='tango')
+        g.add_user_css(css_path)
+        html = g.render()
+        self.assertEqual(html.count('url("data:image/png;base64,'), 1)
+        self.assertEqual(html.count('url(data:image/png;base64,'), 1)
+        self.assertEqual(html.count("url('data:image/png;base64,"), 1)
+        self.assertTrue('<code>url(pic.png)</code>' in html)
+        self.assertEqual(g.user_css[0]['contents'],
+                         'h1 {background: url("pic.png");} '
+                         'h2 {background: url(pic.png);}')
+
+    def test_assets_dir(self):
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        shutil.copy(os.path.join(DATA_DIR, 'img.png'), source_dir)
+        css_path = os.path.join(source_dir, 'user.css')
+        with open(css_path, 'w') as css:
+            css.write('h1 {background: url("img.png");}')
+        source = os.path.join(source_dir, 'slides.md')
+        with open(source, 'w') as slides:
+            slides.write('# 1\n\n![a](img.png)\n\n---\n\n# 2\n\n'
+                         '![b](img.png)')
+        destination = os.path.join(source_dir, 'presentation.html')
+        assets_dir = os.path.join(source_dir, 'static')
+
+        g = Generator(source, destination_file=destination,
+                      assets_dir=assets_dir, theme='tango', cache=False)
+        g.add_user_css(css_path)
+        g.write()
+        with open(destination) as presentation:
+            html = presentation.read()
+        images = re.findall(r'src="(static/img\.\w{12}\.png)"', html)
+        self.assertEqual(len(images), 2)
+        self.assertEqual(images[0], images[1])
+        self.assertFalse('file://' in html)
+        self.assertTrue(re.search(r'src="static/slides\.\w{12}\.js"', html))
+
+        files = sorted(os.listdir(assets_dir))
+        self.assertEqual(len([name for name in files
+                              if name.startswith('img.')]), 1)
+        self.assertEqual(len([name for name in files
+                              if name.startswith('background.')]), 1)
+        for css_url in re.findall(r'href="(static/\w+\.\w{12}\.css)"', html):
+            with open(os.path.join(source_dir, css_url)) as css:
+                for url in re.findall(r'url\([\'"]?([^)\'"]+)', css.read()):
+                    self.assertTrue(url in files)
+
+        # a changed image gets a new name, and the previous copies of the
+        # image and of the stylesheet referencing it are removed
+        g.write()
+        self.assertEqual(sorted(os.listdir(assets_dir)), files)
+        with open(os.path.join(source_dir, 'img.png'), 'ab') as image:
+            image.write(b'\0')
+        g.invalidate([os.path.join(source_dir, 'img.png')])
+        g.write()
+        rebuilt = sorted(os.listdir(assets_dir))
+        self.assertEqual(len(rebuilt), len(files))
+        self.assertEqual(len(set(files) - set(rebuilt)), 2)
+        self.assertFalse(images[0].split('/')[1] in rebuilt)
+
+        # files another presentation links to are kept
+        other = Generator(source, assets_dir=assets_dir, theme='tango',
+                          destination_file=os.path.join(source_dir,
+                                                        'other.html'))
+        other.write()
+        with open(os.path.join(source_dir, 'other.html')) as presentation:
+            shared = re.findall(r'src="static/(img\.\w{12}\.png)"',
+                                presentation.read())[0]
+        with open(os.path.join(source_dir, 'img.png'), 'ab') as image:
+            image.write(b'\0')
+        g.invalidate([os.path.join(source_dir, 'img.png')])
+        g.write()
+        self.assertTrue(shared in os.listdir(assets_dir))
+        self.assertEqual(len([name for name in os.listdir(assets_dir)
+                              if name.startswith('img.')]), 2)
+
+        self.assertRaises(IOError, Generator, source, embed=True,
+                          assets_dir=assets_dir)
+
     def test_get_toc(self):
         base_dir = os.path.join(DATA_DIR, 'test.md')
         g = Generator(base_dir, logger=self.logtest)
@@ -74,6 +222,68 @@ class GeneratorTest(BaseTestCase):
         self.assertTrue(s.find('<pre>') != -1)
         self.assertEqual(len(re.findall('<pre><span', s)), 3)
 
+    def test_render_stream(self):
+        g = Generator(os.path.join(DATA_DIR, 'test.md'))
+        chunks = list(g.render_stream())
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(u''.join(chunks), g.render())
+
+    def test_direct_output(self):
+        g = Generator(os.path.join(DATA_DIR, 'encoding.rst'), direct=True,
+                      encoding='koi8_r')
+        stdout = io.TextIOWrapper(io.BytesIO())
+        self.addCleanup(setattr, sys, 'stdout', sys.stdout)
+        sys.stdout = stdout
+        g.execute()
+        output = stdout.buffer.getvalue()
+        self.assertTrue(output.startswith(b'<!DOCTYPE html>'))
+        self.assertTrue(u'русский'.encode('koi8_r') in output)
+
+    def test_profile(self):
+        self.assertFalse(Generator(os.path.join(DATA_DIR, 'test.md'))
+                         .tracer.enabled)
+
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        profile = os.path.join(output_dir, 'trace.json')
+        g = Generator(os.path.join(DATA_DIR, 'test.md'), profile=profile,
+                      destination_file=os.path.join(output_dir, 'out.html'))
+        g.execute()
+        with open(profile) as trace_file:
+            events = json.load(trace_file)['traceEvents']
+        names = set(event['name'] for event in events if event['ph'] == 'X')
+        for name in ('build', 'parse_source', 'parse', 'render', 'write',
+                     'CodeHighlightingMacro', 'DirectiveScanner',
+                     'FixImagePathsMacro'):
+            self.assertTrue(name in names, name)
+        self.assertEqual(events[0]['args']['name'], 'landslide')
+
+        # each build writes its own timeline
+        g.write_and_log()
+        with open(profile) as trace_file:
+            rebuilt = json.load(trace_file)['traceEvents']
+        self.assertEqual(len([event for event in rebuilt
+                              if event['name'] == 'build']), 1)
+        self.assertFalse(g.tracer.events)
+
+    def test_template_environment(self):
+        g = Generator(os.path.join(DATA_DIR, 'test.md'))
+        self.assertTrue(g.get_template() is g.get_template())
+        self.assertTrue(get_environment(os.path.dirname(g.template_file)) is
+                        get_environment(os.path.dirname(g.template_file)))
+
+        theme_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, theme_dir)
+        os.mkdir(os.path.join(theme_dir, 'css'))
+        with open(os.path.join(theme_dir, 'css', 'screen.css'), 'w') as css:
+            css.write('')
+        with open(os.path.join(theme_dir, 'base.html'), 'w') as base:
+            base.write('{% include "title.html" %}')
+        with open(os.path.join(theme_dir, 'title.html'), 'w') as partial:
+            partial.write('<h1>{{ head_title }}</h1>')
+        g = Generator(os.path.join(DATA_DIR, 'test.md'), theme=theme_dir)
+        self.assertEqual(g.render(), '<h1>Title Slide</h1>')
+
     def test_inputencoding(self):
         path = os.path.join(DATA_DIR, 'encoding.rst')
         g = Generator(path, encoding='koi8_r')
@@ -109,6 +319,34 @@ class GeneratorTest(BaseTestCase):
         self.assertEqual(r[1][0], 'blah')
         self.assertEqual(r[1][1], 'blob')
 
+    def test_macro_pipeline(self):
+        g = Generator(os.path.join(DATA_DIR, 'test.md'), linenos='no')
+        pipeline = g.get_macro_pipeline()
+        self.assertEqual(len(pipeline), 2)
+        self.assertTrue(isinstance(pipeline[1], macro.DirectiveScanner))
+        self.assertEqual([type(m) for m in pipeline[1].macros], g.macros[1:])
+        g.process_macros('<pre><code>!python\nfoo</code></pre>')
+        self.assertTrue(g.get_macro_pipeline() is pipeline)
+        self.assertEqual(pipeline[0].options['linenos'], 'no')
+
+        class SampleMacro(macro.Macro):
+            pass
+
+        g.register_macro(SampleMacro)
+        self.assertTrue(isinstance(g.get_macro_pipeline()[-1], SampleMacro))
+
+        # directive macros with their own process() are not scanned
+        class SampleFxMacro(macro.FxMacro):
+            def process(self, content, source=None):
+                return content.upper(), ['sample']
+
+        g = Generator(os.path.join(DATA_DIR, 'test.md'))
+        g.macros = []
+        g.register_macro(SampleFxMacro)
+        self.assertTrue(isinstance(g.get_macro_pipeline()[0], SampleFxMacro))
+        self.assertEqual(g.process_macros('<p>.fx: foo</p>'),
+                         ('<P>.FX: FOO</P>', ['sample']))
+
     def test_register_macro(self):
         g = Generator(os.path.join(DATA_DIR, 'test.md'))
 
@@ -144,8 +382,350 @@ class GeneratorTest(BaseTestCase):
         self.assertEqual(svars['presenter_notes'], None)
 
 
+    def test_parse_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        g = Generator(os.path.join(DATA_DIR, 'test.md'), cache_dir=cache_dir)
+        parser = Parser('.md')
+        html = g.parse(parser, '# heading')
+        self.assertEqual(len(os.listdir(os.path.join(cache_dir, 'parse'))), 1)
+        parser.parse = None
+        self.assertEqual(g.parse(parser, '# heading'), html)
+
+        # entries of other library versions aren't reused
+        parser = Parser('.md')
+        parser.get_versions = lambda: u'markdown 0.0'
+        self.assertEqual(g.parse(parser, '# heading'), html)
+        self.assertEqual(len(os.listdir(os.path.join(cache_dir, 'parse'))), 2)
+
+        g = Generator(os.path.join(DATA_DIR, 'test.md'), cache_dir=cache_dir,
+                      clear_cache=True, cache=False)
+        self.assertEqual(os.listdir(os.path.join(cache_dir, 'parse')), [])
+        self.assertEqual(g.parse(Parser('.md'), '# heading'), html)
+        self.assertEqual(os.listdir(os.path.join(cache_dir, 'parse')), [])
+
+    def test_parse_cache_includes(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        included = os.path.join(cache_dir, 'included.txt')
+        text = 'Title\n=====\n\n.. include:: %s\n' % included
+        g = Generator(os.path.join(DATA_DIR, 'test.md'), cache_dir=cache_dir)
+        parser = Parser('.rst')
+        with open(included, 'w') as included_file:
+            included_file.write('first text')
+        self.assertTrue('first text' in g.parse(parser, text))
+        with open(included, 'w') as included_file:
+            included_file.write('second text')
+        self.assertTrue('second text' in g.parse(parser, text))
+        self.assertFalse(os.path.exists(os.path.join(cache_dir, 'parse')))
+
+        self.assertTrue(parser.reads_files(
+            '.. csv-table::\n   :file: data.csv\n'))
+        self.assertFalse(parser.reads_files('Title\n=====\n'))
+        self.assertFalse(Parser('.md').reads_files('.. include:: a.txt'))
+
+    def test_split_sources(self):
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        source = os.path.join(source_dir, 'slides.md')
+        with open(source, 'w') as slides:
+            slides.write('# One\n\n---\n\n# Two\nSub\n---\n\n'
+                         '```\n\n---\n```\n\n***\n\n# Three')
+        g = Generator(source, cache_dir=cache_dir, split_sources=True)
+        html = g.render()
+        self.assertEqual(html, Generator(source, cache=False).render())
+        self.assertEqual(len(g.parse_cache.entries()), 3)
+
+        with open(source, 'w') as slides:
+            slides.write('# One\n\n---\n\n# Two\nSub\n---\n\n'
+                         '```\n\n---\n```\n\n***\n\n# Four')
+        g = Generator(source, cache_dir=cache_dir, split_sources=True)
+        self.assertTrue('<h1>Four</h1>' in g.render())
+        self.assertEqual(len(g.parse_cache.entries()), 4)
+
+        parser = Parser('.rst')
+        preamble = 'landslide-section-level-1\n%s\n\n' % ('=' * 25)
+        self.assertEqual(parser.split('A\n====\n\n----\n\nB\n====\n'),
+                         [preamble + 'A\n====\n', preamble + '\nB\n====\n'])
+        self.assertEqual(len(parser.split('----\nA\n----\n')), 1)
+        self.assertEqual(Parser('.textile').split('h1. A\n---\nh1. B'),
+                         ['h1. A', 'h1. B'])
+
+    def test_incremental_rebuild(self):
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        for name in ('a.md', 'b.md'):
+            with open(os.path.join(source_dir, name), 'w') as source:
+                source.write('# %s\n\n---\n\n# %s 2' % (name, name))
+        g = Generator(source_dir, cache=False, jobs=1)
+        parsed = []
+        parse = g.parse
+        g.parse = lambda parser, text, part=False: \
+            parsed.append(text) or parse(parser, text, part)
+        g.render()
+        self.assertEqual(len(parsed), 2)
+        g.render()
+        self.assertEqual(len(parsed), 2)
+
+        with open(os.path.join(source_dir, 'b.md'), 'w') as source:
+            source.write('# b.md\n\n---\n\n# B 2')
+        g.invalidate([os.path.join(source_dir, 'b.md')])
+        html = g.render()
+        self.assertEqual(len(parsed), 3)
+        self.assertTrue('<h1>B 2</h1>' in html)
+        self.assertTrue('<h1>a.md 2</h1>' in html)
+        self.assertEqual(len(re.findall('<div class="slide ', html)), 4)
+
+    def test_jobs(self):
+        source = os.path.join(os.path.dirname(__file__), 'examples',
+                              'multiple-files')
+        self.assertEqual(Generator(source, cache=False).jobs, 1)
+        serial = Generator(source, cache=False, jobs=1).render()
+        self.assertEqual(Generator(source, cache=False, jobs=2).render(),
+                         serial)
+
+        # generators which can't be pickled parse their sources serially
+        messages = []
+        g = Generator(source, cache=False, jobs=2, verbose=True,
+                      logger=lambda message, type='notice':
+                          messages.append(message))
+        self.assertEqual(g.render(), serial)
+        self.assertTrue(any(message.startswith(u"Parsing  sources serially")
+                            for message in messages))
+
+    def test_share_images(self):
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        shutil.copy(os.path.join(DATA_DIR, 'img.png'), source_dir)
+        with open(os.path.join(source_dir, 'slides.md'), 'w') as source:
+            source.write('# 1\n\n![a](img.png)\n\n---\n\n# 2\n\n'
+                         '![b](img.png)')
+        source = os.path.join(source_dir, 'slides.md')
+        html = Generator(source, embed=True).render()
+        self.assertEqual(html.count('data:image/png;base64'), 1)
+        self.assertEqual(html.count('<img alt="a" data-image="image0" />'), 1)
+        self.assertTrue('id="image_table"' in html)
+
+        html = Generator(source, embed=True, theme='ribbon').render()
+        self.assertFalse('data-image=' in html)
+        self.assertTrue('<img alt="b" src="data:image/png;base64' in html)
+
+    def test_lazy_images(self):
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        shutil.copy(os.path.join(DATA_DIR, 'img.png'), source_dir)
+        with open(os.path.join(source_dir, 'slides.md'), 'w') as source:
+            source.write('# 1\n\n![a](img.png)\n\n---\n\n# 2\n\n'
+                         '![b](img.png)\n\n---\n\n# 3\n\n![c](img.svg)'
+                         '\n\n<iframe src="data:text/html,frame"></iframe>')
+        with open(os.path.join(source_dir, 'img.svg'), 'w') as svg:
+            svg.write('<svg xmlns="http://www.w3.org/2000/svg"/>')
+        source = os.path.join(source_dir, 'slides.md')
+
+        html = Generator(source, embed=True).render()
+        self.assertTrue('<img alt="c" src="data:image/svg+xml' in html)
+
+        html = Generator(source, embed=True, lazy_images=True).render()
+        self.assertFalse('<img alt="a" src="data:' in html)
+        self.assertEqual(html.count('data-image="image0"'), 2)
+        self.assertEqual(html.count('<img alt="c" data-image="image1" />'), 1)
+        table = re.search(r'<script type="application/json" '
+                          r'id="image_table">(.*?)</script>', html).group(1)
+        self.assertEqual(sorted(json.loads(table)), ['image0', 'image1'])
+        # only images are hydrated from the table
+        self.assertTrue('<iframe src="data:text/html,frame">' in html)
+
+    def test_minify(self):
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        source = os.path.join(source_dir, 'slides.md')
+        with open(source, 'w') as slides:
+            slides.write('# Title\n\nSome   text\n\n    keep    this\n'
+                         '      indented')
+        cache_dir = os.path.join(source_dir, 'cache')
+
+        html = Generator(source, embed=True, cache_dir=cache_dir).render()
+        g = Generator(source, embed=True, cache_dir=cache_dir, minify=True)
+        minified = g.render()
+        self.assertTrue(len(minified) < len(html))
+        self.assertFalse('/*' in minified)
+        self.assertTrue('keep    this\n  indented' in minified)
+        self.assertTrue('<p>Some text</p>' in minified)
+        self.assertFalse('\n\n' in minified)
+
+        # minified assets are cached by contents
+        self.assertEqual(len(g.minify_cache.entries()), 3)
+        g = Generator(source, embed=True, cache_dir=cache_dir, minify=True)
+        minify_css, minify_js = minify.minify_css, minify.minify_js
+        minify.minify_css = minify.minify_js = None
+        try:
+            self.assertEqual(g.render(), minified)
+        finally:
+            minify.minify_css, minify.minify_js = minify_css, minify_js
+
+    def test_split_output(self):
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        for name in ('a.md', 'b.md'):
+            with open(os.path.join(source_dir, name), 'w') as source:
+                source.write('# %s\n\n---\n\n# %s 2\n\nText' % (name, name))
+        destination = os.path.join(source_dir, 'out', 'deck.html')
+        fragments_dir = os.path.join(source_dir, 'out', 'deck_fragments')
+        os.makedirs(os.path.dirname(destination))
+
+        g = Generator(source_dir, destination_file=destination, cache=False,
+                      split_output='slide')
+        self.assertEqual(g.get_fragments_dir(), fragments_dir)
+        self.assertTrue(g.write())
+        with open(destination) as shell:
+            html = shell.read()
+        self.assertEqual(html.count('data-fragment="deck_fragments/slide-'),
+                         4)
+        self.assertTrue('<header><h1>b.md 2</h1></header>' in html)
+        self.assertFalse('<p>Text</p>' in html)
+        self.assertTrue('href="#slide4">b.md 2</a>' in html)
+        self.assertEqual(sorted(os.listdir(fragments_dir)),
+                         ['slide-%04d.js' % number for number in range(1, 5)])
+        with open(os.path.join(fragments_dir, 'slide-0004.js')) as fragment:
+            script = fragment.read()
+        self.assertTrue(script.startswith('addSlideFragment("'))
+        html = json.loads(script[len('addSlideFragment('):-len(');\n')])
+        self.assertTrue('<h1>b.md 2</h1>' in html)
+        self.assertTrue('<p>Text</p>' in html)
+        self.assertTrue('slide-4"' in html)
+        self.assertFalse(g.write())
+
+        g = Generator(source_dir, destination_file=destination, cache=False,
+                      split_output='source')
+        self.assertTrue(g.write())
+        self.assertEqual(sorted(os.listdir(fragments_dir)),
+                         ['source-001.js', 'source-002.js'])
+        with open(os.path.join(fragments_dir, 'source-002.js')) as fragment:
+            self.assertEqual(fragment.read().count('slide-wrapper'), 2)
+
+        g = Generator(source_dir, destination_file=destination, cache=False,
+                      split_output='source', theme='ribbon')
+        self.assertRaises(IOError, g.write)
+        self.assertRaises(ValueError, Generator, source_dir,
+                          split_output='page')
+        g = Generator(source_dir, cache=False, split_output='slide',
+                      serve=True)
+        self.assertRaises(IOError, g.execute)
+
+
+class MinifyTest(BaseTestCase):
+    def test_minify_css(self):
+        self.assertEqual(minify.minify_css(
+            '/* theme */\nbody {\n  color: red;\n  font: 12px "A  B";\n}\n'
+            'a > b, .c .d { margin : 0 }'),
+            'body{color: red;font: 12px "A  B"}a>b,.c .d{margin : 0}')
+
+    def test_minify_js(self):
+        self.assertEqual(minify.minify_js(
+            '// comment\nvar a = 1, b = a / 2 / 3;  /* c */\n'
+            'var re = /a\\/b [/]/g.test(" x  y ");\n\n'
+            'a = b + +c - -d;\nreturn /y/;'),
+            'var a=1,b=a/2/3;\nvar re=/a\\/b [/]/g.test(" x  y ");\n'
+            'a=b+ +c- -d;\nreturn/y/;')
+
+    def test_minify_html(self):
+        self.assertEqual(minify.minify_html(
+            '<div>\n  <!-- note -->\n  <p>a   b</p>\n</div>\n'
+            '<pre>  x\n\n  y</pre> <script>var a  = 1;</script>\n'
+            '<!--[if IE]>  <p>old</p> <![endif]-->'),
+            '<div>\n<p>a b</p>\n</div>\n<pre>  x\n\n  y</pre> '
+            '<script>var a  = 1;</script>\n<!--[if IE]>  <p>old</p> '
+            '<![endif]-->')
+
+        # quoted attribute values are kept as they are
+        self.assertEqual(minify.minify_html(
+            '<p  title="a   b > c"\n   data-x=\'1  2\'  class=x>'
+            'it\'s   "a  b"</p>'),
+            '<p title="a   b > c"\ndata-x=\'1  2\' class=x>it\'s "a b"</p>')
+
+
+class FileCacheTest(BaseTestCase):
+    def setUp(self):
+        BaseTestCase.setUp(self)
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_get_set(self):
+        c = FileCache(self.cache_dir)
+        self.assertEqual(c.get('foo'), None)
+        c.set('foo', u'bär')
+        self.assertEqual(c.get('foo'), u'bär')
+        c.clear()
+        self.assertEqual(c.get('foo'), None)
+
+    def test_evict(self):
+        c = FileCache(self.cache_dir, max_size=10)
+        c.set('a', '12345')
+        c.set('b', '12345')
+        os.utime(c.path('a'), (1, 1))
+        os.utime(c.path('b'), (2, 2))
+        c.get('a')
+        c.set('c', '12345')
+        self.assertEqual(c.get('b'), None)
+        self.assertEqual(c.get('a'), '12345')
+        self.assertEqual(c.get('c'), '12345')
+
+    def test_set_failures(self):
+        c = FileCache(self.cache_dir)
+        c.set('a', '12345')
+        c.evict()
+        c.set('a', '1234567')
+        self.assertEqual(c._size, 7)
+
+        # failed writes don't leave temporary files behind
+        with mock.patch('os.replace', side_effect=OSError):
+            c.set('b', '12345')
+        self.assertEqual(os.listdir(self.cache_dir), ['a'])
+        self.assertEqual(c._size, 7)
+
+
+class BuildSchedulerTest(BaseTestCase):
+    def test_debounce(self):
+        builds = []
+        done = threading.Event()
+        s = BuildScheduler(lambda paths, is_cancelled: builds.append(paths)
+                           or done.set(), debounce=0.1)
+        s.start()
+        self.addCleanup(s.stop)
+        for path in ('a.md', 'b.md', 'a.md'):
+            s.schedule([path])
+        self.assertTrue(done.wait(5))
+        self.assertEqual(builds, [['a.md', 'b.md']])
+
+    def test_cancel(self):
+        builds = []
+        started = threading.Event()
+        done = threading.Event()
+
+        def build(paths, is_cancelled):
+            builds.append(paths)
+            if len(builds) == 1:
+                started.set()
+                while not is_cancelled():
+                    pass
+                raise BuildCancelled()
+            done.set()
+
+        s = BuildScheduler(build, debounce=0)
+        s.start()
+        self.addCleanup(s.stop)
+        s.schedule(['a.md'])
+        self.assertTrue(started.wait(5))
+        s.schedule(['b.md'])
+        self.assertTrue(done.wait(5))
+        self.assertEqual(builds, [['a.md'], ['a.md', 'b.md']])
+
+
 class CodeHighlightingMacroTest(BaseTestCase):
     def setUp(self):
+        BaseTestCase.setUp(self)
         self.sample_html = '''<p>Let me give you this snippet:</p>
 <pre class="literal-block">
 !python
@@ -208,6 +788,86 @@ echo $bar;
         self.assertEqual(hl[1][0], u'has_code')
 
 
+class HighlightTest(BaseTestCase):
+    def test_shared_lexers_and_formatters(self):
+        self.assertTrue(highlight.get_lexer('python') is
+                        highlight.get_lexer('python'))
+        self.assertFalse(highlight.get_lexer('python') is
+                         highlight.get_lexer('python', startinline=True))
+        self.assertTrue(highlight.get_formatter(hl_lines=['1']) is
+                        highlight.get_formatter(hl_lines=['1']))
+        self.assertRaises(ValueError, highlight.get_lexer, 'nosuchlexer')
+
+    def test_highlight(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        disk_cache = FileCache(cache_dir)
+        html = highlight.highlight('print(42)', 'python',
+                                   disk_cache=disk_cache, linenos='table')
+        self.assertTrue('<table class="highlighttable">' in html)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        self.assertTrue(highlight.highlight('print(42)', 'python',
+                                            linenos='table') is html)
+
+    def test_generator_caches(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        source = os.path.join(cache_dir, 'slides.rst')
+        with open(source, 'w') as slides:
+            slides.write('Code\n====\n\n.. sourcecode:: python\n\n'
+                         '    print(%r)\n' % cache_dir)
+        g = Generator(source, cache_dir=cache_dir)
+        # generators without caches don't disable the ones of others
+        Generator(source, cache=False).render()
+        highlight._highlighted.clear()
+        g.render()
+        self.assertEqual(len(os.listdir(os.path.join(cache_dir,
+                                                     'highlight'))), 1)
+
+
+class DirectiveScannerTest(BaseTestCase):
+    def test_process(self):
+        s = macro.DirectiveScanner([macro.FixImagePathsMacro(self.logtest),
+                                    macro.FxMacro(self.logtest),
+                                    macro.NotesMacro(self.logtest),
+                                    macro.QRMacro(self.logtest)])
+        content, classes = s.process(
+            '<p>.notes: a <img src="a.png"/></p>\n<p>.fx: foo</p>\n'
+            '<img alt="a.png" src="a.png"/><p>.notes: b</p>\n'
+            '<img src="http://b.png"/><p>.qr: 10|data</p>\n<p>.fx: bar</p>',
+            os.path.join(DATA_DIR, 'test.md'))
+        self.assertEqual(classes, ['foo', 'has_notes', 'has_qr'])
+        self.assertEqual(content.count('src="file://'), 2)
+        self.assertEqual(content.count('alt="a.png"'), 1)
+        self.assertEqual(content.count('<p class="notes">'), 2)
+        self.assertTrue('<p class="qr"><img src="https://chart.apis.google.'
+                        'com/chart?chs=10x10&cht=qr&chl=data' in content)
+        self.assertTrue('<img src="http://b.png"/>' in content)
+        self.assertTrue(content.endswith('<p>.fx: bar</p>'))
+
+    def test_on_error(self):
+        errors = []
+        s = macro.DirectiveScanner([macro.EmbedImagesMacro(self.logtest,
+                                                           True),
+                                    macro.NotesMacro(self.logtest)],
+                                   on_error=lambda *args: errors.append(args))
+        content, classes = s.process('<img src="nope.png"/><p>.notes: a</p>',
+                                     os.path.join(DATA_DIR, 'test.md'))
+        self.assertEqual(content, '<img src="nope.png"/><p class="notes">a</p>')
+        self.assertEqual(classes, ['has_notes'])
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(isinstance(errors[0][2], WarningMessage))
+
+        # images embedded before the failure are rolled back as well
+        errors = []
+        content, classes = s.process('<img src="img.png"/>'
+                                     '<img src="nope.png"/><p>.notes: a</p>',
+                                     os.path.join(DATA_DIR, 'test.md'))
+        self.assertEqual(content, '<img src="img.png"/><img src="nope.png"/>'
+                                  '<p class="notes">a</p>')
+        self.assertEqual(len(errors), 1)
+
+
 class EmbedImagesMacroTest(BaseTestCase):
     def test_process(self):
         base_dir = os.path.join(DATA_DIR, 'test.md')
@@ -219,6 +879,130 @@ class EmbedImagesMacroTest(BaseTestCase):
                           content)
         self.assertTrue(base64.b64decode(match.group(1)))
 
+        m = macro.EmbedImagesMacro(None, True)
+        content, classes = m.process('<img src="img.png"/>' * 2, base_dir)
+        self.assertEqual(content.count('src="data:image/png;base64,'), 2)
+
+
+class UtilsTest(BaseTestCase):
+    def test_encode_image_from_url(self):
+        image_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, image_dir)
+        image = os.path.join(image_dir, 'img.png')
+        shutil.copy(os.path.join(DATA_DIR, 'img.png'), image)
+        encoded = utils.encode_image_from_url('img.png', image_dir)
+        self.assertTrue(encoded.startswith('data:image/png;base64,'))
+        self.assertTrue(utils.encode_image_from_url(image, '.') is encoded)
+        with open(image, 'ab') as image_file:
+            image_file.write(b'\0')
+        self.assertNotEqual(utils.encode_image_from_url(image, '.'), encoded)
+
+        # the least recently used images are dropped over the size limit
+        other = os.path.join(image_dir, 'other.png')
+        shutil.copy(os.path.join(DATA_DIR, 'img.png'), other)
+        images = utils._EncodedImages(len(encoded) * 2)
+        with mock.patch.object(utils, '_encoded_images', images):
+            utils.encode_image_from_url(image, '.')
+            utils.encode_image_from_url(other, '.')
+            utils.encode_image_from_url(image, '.')
+            self.assertEqual(len(images), 1)
+            self.assertEqual(list(images)[0][0], image)
+            self.assertEqual(images.size, len(list(images.values())[0][1]))
+
+    def test_write_if_changed(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        path = os.path.join(output_dir, 'presentation.html')
+        self.assertTrue(utils.write_if_changed(path, [b'<p>', b'one</p>']))
+        os.utime(path, ns=(0, 0))
+
+        self.assertFalse(utils.write_if_changed(path, [b'<p>one</p>']))
+        self.assertEqual(os.stat(path).st_mtime_ns, 0)
+
+        self.assertTrue(utils.write_if_changed(path, [b'<p>two</p>']))
+        with open(path, 'rb') as output:
+            self.assertEqual(output.read(), b'<p>two</p>')
+        self.assertEqual(os.listdir(output_dir), ['presentation.html'])
+
+        # new outputs get the default mode and replaced ones keep theirs,
+        # without touching the umask of the threads writing files meanwhile
+        os.remove(path)
+        with mock.patch('os.umask', side_effect=AssertionError):
+            self.assertTrue(utils.write_if_changed(path, [b'<p>mode</p>']))
+            self.assertEqual(os.stat(path).st_mode & 0o777,
+                             utils.DEFAULT_FILE_MODE)
+            os.chmod(path, 0o640)
+            self.assertTrue(utils.write_if_changed(path, [b'<p>two</p>']))
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+
+        # a failed build leaves the previous output in place
+        def chunks():
+            yield b'<p>three'
+            raise BuildCancelled(u"Build cancelled")
+        self.assertRaises(BuildCancelled, utils.write_if_changed, path,
+                          chunks())
+        with open(path, 'rb') as output:
+            self.assertEqual(output.read(), b'<p>two</p>')
+        self.assertEqual(os.listdir(output_dir), ['presentation.html'])
+
+
+@unittest.skipUnless(Image, "Pillow is not installed")
+class ImageProcessorTest(BaseTestCase):
+    def setUp(self):
+        BaseTestCase.setUp(self)
+        self.image_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.image_dir)
+        self.image = os.path.join(self.image_dir, 'photo.jpg')
+        Image.effect_noise((1600, 1200), 64).convert('RGB').save(
+            self.image, 'JPEG', quality=98)
+        with open(self.image, 'rb') as image_file:
+            self.contents = image_file.read()
+
+    def test_process(self):
+        cache = FileCache(os.path.join(self.image_dir, 'cache'))
+        processor = images.ImageProcessor('400x400', cache=cache)
+        processed = processor.process(self.image, self.contents,
+                                      'image/jpeg')
+        self.assertTrue(len(processed) < len(self.contents))
+        self.assertEqual(Image.open(io.BytesIO(processed)).size, (400, 300))
+        self.assertEqual(processor.flush(), {
+            self.image: (len(self.contents), len(processed))})
+        self.assertEqual(processor.flush(), {})
+
+        # processed images are cached by contents and settings
+        processor = images.ImageProcessor((400, 400), cache=cache)
+        processor.recompress = None
+        self.assertEqual(processor.process(self.image, self.contents,
+                                           'image/jpeg'), processed)
+        self.assertEqual(len(cache.entries()), 1)
+        processor = images.ImageProcessor('400x400', quality=50, cache=cache)
+        self.assertNotEqual(processor.process(self.image, self.contents,
+                                              'image/jpeg'), processed)
+
+        self.assertEqual(processor.process(self.image, b'<svg/>',
+                                           'image/svg+xml'), b'<svg/>')
+        self.assertRaises(ValueError, images.ImageProcessor, '400')
+
+    def test_embed(self):
+        source = os.path.join(self.image_dir, 'slides.md')
+        with open(source, 'w') as slides:
+            slides.write('# Photo\n\n![photo](photo.jpg)')
+        messages = []
+        g = Generator(source, embed=True, cache=False, verbose=True,
+                      image_max_size='800x800',
+                      logger=lambda message, type='notice':
+                          messages.append(message))
+        html = g.render()
+        encoded = re.search(r'src="data:image/jpeg;base64,([^"]+)"', html)
+        image = Image.open(io.BytesIO(base64.b64decode(encoded.group(1))))
+        self.assertEqual(image.size, (800, 600))
+        self.assertTrue(any(message.startswith(u"Resized  %s: %d -> "
+                                               % (self.image,
+                                                  len(self.contents)))
+                            for message in messages))
+        self.assertTrue(any(message.startswith(u"Resized  1 images, ")
+                            for message in messages))
+
 
 class FixImagePathsMacroTest(BaseTestCase):
     def test_process(self):
@@ -247,6 +1031,205 @@ class NotesMacroTest(BaseTestCase):
         self.assertEqual(r[1], [u'has_notes'])
 
 
+class BatchTest(BaseTestCase):
+    def setUp(self):
+        BaseTestCase.setUp(self)
+        self.deck_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.deck_dir)
+        self.config_files = []
+        for name, source in (('a', os.path.join(DATA_DIR, 'test.md')),
+                             ('b', os.path.join(DATA_DIR, 'test.md')),
+                             ('c', os.path.join(DATA_DIR, 'missing.md'))):
+            config_file = os.path.join(self.deck_dir, '%s.cfg' % name)
+            with open(config_file, 'w') as config:
+                config.write('[landslide]\nsource = %s\ndestination = %s\n'
+                             % (source, os.path.join(self.deck_dir,
+                                                     '%s.html' % name)))
+            self.config_files.append(config_file)
+
+    def check_results(self, results):
+        self.assertEqual([result['status'] for result in results],
+                         ['ok', 'ok', 'error'])
+        for name in ('a', 'b'):
+            self.assertTrue(os.path.exists(os.path.join(self.deck_dir,
+                                                         '%s.html' % name)))
+        lines = batch.format_summary(results, 1.0)
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[1].startswith(self.config_files[0]))
+        self.assertEqual(lines[-1], '3 decks, 1 failed in 1.000s')
+
+    def test_build_decks(self):
+        self.check_results(batch.build_decks(self.config_files, jobs=1,
+                                             cache=False))
+
+    def test_build_decks_pool(self):
+        self.check_results(batch.build_decks(self.config_files, jobs=2,
+                                             cache=False))
+
+    def test_shared_destinations(self):
+        config_files = self.config_files[:2]
+        with open(config_files[1], 'w') as config:
+            config.write('[landslide]\nsource = %s\ndestination = %s\n'
+                         % (os.path.join(DATA_DIR, 'test.md'),
+                            os.path.join(self.deck_dir, 'a.html')))
+        config_files.append(os.path.join(self.deck_dir, 'd.cfg'))
+        with open(config_files[2], 'w') as config:
+            config.write('[landslide]\nsource = %s\n'
+                         % os.path.join(DATA_DIR, 'test.md'))
+        results = batch.build_decks(config_files, jobs=1, cache=False)
+        self.assertEqual([result['status'] for result in results],
+                         ['error', 'error', 'ok'])
+        self.assertTrue(results[0]['error'].endswith(config_files[1]))
+        self.assertFalse(os.path.exists(os.path.join(self.deck_dir,
+                                                     'a.html')))
+
+    def test_invalid_batch(self):
+        self.assertRaises(IOError, batch.build_decks,
+                          [os.path.join(DATA_DIR, 'test.md')] * 2)
+        for option in ('watch', 'serve', 'direct', 'profile'):
+            self.assertRaises(RuntimeError, batch.build_decks,
+                              self.config_files, **{option: True})
+
+
+class PreviewServerTest(BaseTestCase):
+    def setUp(self):
+        BaseTestCase.setUp(self)
+        self.source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source_dir)
+        self.source = os.path.join(self.source_dir, 'slides.md')
+        with open(self.source, 'w') as source:
+            source.write('# Title\n\n---\n\n# First\n\n![img](img.png)')
+        shutil.copy(os.path.join(DATA_DIR, 'img.png'), self.source_dir)
+
+        g = Generator(self.source, serve=True, cache=False)
+        self.assertTrue(g.embed)
+        self.server = server.PreviewServer(g, port=0)
+        self.server.build()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.close)
+
+    def get(self, path):
+        connection = http.client.HTTPConnection(*self.server.server_address,
+                                                timeout=5)
+        self.addCleanup(connection.close)
+        connection.request('GET', path)
+        return connection.getresponse()
+
+    def test_presentation(self):
+        response = self.get('/')
+        self.assertEqual(response.status, 200)
+        html = response.read().decode('utf_8')
+        self.assertTrue('<h1>First</h1>' in html)
+        self.assertTrue('src="data:image/png;base64,' in html)
+        self.assertTrue("new EventSource('/events?build=1')" in html)
+        self.assertEqual(self.get('/missing').status, 404)
+
+    def test_reload_event(self):
+        response = self.get('/events?build=1')
+        self.assertEqual(response.getheader('Content-Type'),
+                         'text/event-stream')
+
+        # a new presentation title changes more than slides
+        with open(self.source, 'w') as source:
+            source.write('# New Title\n\n---\n\n# Second')
+        self.server.build([self.source])
+        self.assertEqual(response.fp.readline(), b'event: reload\n')
+        self.assertEqual(response.fp.readline(), b'data: 2\n')
+        self.assertTrue('<h1>Second</h1>' in
+                        self.get('/').read().decode('utf_8'))
+
+        # pages of an older build reload right away
+        response = self.get('/events?build=1')
+        self.assertEqual(response.fp.readline(), b'event: reload\n')
+
+    def test_patch_event(self):
+        html = self.get('/').read().decode('utf_8')
+        fingerprints = re.findall(r'data-fingerprint="(\w+)"', html)
+        self.assertEqual(len(fingerprints), 2)
+        response = self.get('/events?build=1')
+
+        with open(self.source, 'w') as source:
+            source.write('# Title\n\n---\n\n# Second')
+        self.server.build([self.source])
+        self.assertEqual(response.fp.readline(), b'event: patch\n')
+        self.assertEqual(response.fp.readline(), b'id: 2\n')
+        patch = json.loads(response.fp.readline()[len(b'data: '):])
+        self.assertEqual(patch['count'], 2)
+        self.assertEqual([slide['index'] for slide in patch['slides']], [1])
+        self.assertTrue('<h1>Second</h1>' in patch['slides'][0]['html'])
+        self.assertTrue('#slide2">Second</a>' in patch['toc'])
+
+        # only the edited slide got a new fingerprint
+        html = self.get('/').read().decode('utf_8')
+        new_fingerprints = re.findall(r'data-fingerprint="(\w+)"', html)
+        self.assertEqual(new_fingerprints[0], fingerprints[0])
+        self.assertNotEqual(new_fingerprints[1], fingerprints[1])
+        self.assertTrue('data-fingerprint="%s"' % new_fingerprints[1]
+                        in patch['slides'][0]['html'])
+
+        # pages patched to the last build don't reload when reconnecting
+        self.server.keep_alive = 0.1
+        connection = http.client.HTTPConnection(*self.server.server_address,
+                                                timeout=5)
+        self.addCleanup(connection.close)
+        connection.request('GET', '/events?build=1',
+                           headers={'Last-Event-ID': '2'})
+        response = connection.getresponse()
+        self.assertEqual(response.fp.readline(), b': keep-alive\n')
+
+
+    def test_image_keys_reload(self):
+        with open(os.path.join(self.source_dir, 'img.svg'), 'w') as svg:
+            svg.write('<svg xmlns="http://www.w3.org/2000/svg"/>')
+        self.server.generator.lazy_images = True
+        self.server.build([self.source])
+        with open(self.source, 'w') as source:
+            source.write('# Title\n\n---\n\n# First\n\n![img](img.png)'
+                         '\n\n---\n\n# Second\n\n![img](img.svg)')
+        self.server.build([self.source])
+
+        # pages keep the image keys of the slides they didn't hydrate yet,
+        # so renumbered images reload them
+        with open(self.source, 'w') as source:
+            source.write('# Title\n\n---\n\n# First\n\n![img](img.svg)'
+                         '\n\n---\n\n# Second\n\n![img](img.png)')
+        self.server.build([self.source])
+        self.assertEqual(self.server.get_patch(self.server.build_id), None)
+
+
+class MainTest(BaseTestCase):
+    def test_lazy_imports(self):
+        code = ('import sys\n'
+                'from landslide import main\n'
+                'sys.argv = ["landslide", "--version"]\n'
+                'try:\n'
+                '    main.main()\n'
+                'except SystemExit:\n'
+                '    pass\n'
+                'print(",".join(name for name in ("landslide.generator", '
+                '"jinja2", "pygments", "markdown", "docutils") '
+                'if name in sys.modules))\n')
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.dirname(DATA_DIR))
+        self.assertEqual(output.decode().splitlines()[-1], '')
+
+
+    def test_run_inputs(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        destination = os.path.join(output_dir, 'out.html')
+        options = optparse.Values({'destination_file': destination,
+                                   'cache': False})
+        with mock.patch.object(main, 'log') as log:
+            self.assertEqual(main.run([os.path.join(DATA_DIR, 'test.md'),
+                                       os.path.join(DATA_DIR, 'test.css')],
+                                      options), 0)
+        self.assertTrue(os.path.exists(destination))
+        self.assertTrue(log.call_args_list[0][0][0].endswith('test.css'))
+
+
 class ParserTest(BaseTestCase):
     def test___init__(self):
         self.assertEqual(Parser('.md').format, 'markdown')
@@ -254,6 +1237,28 @@ class ParserTest(BaseTestCase):
         self.assertEqual(Parser('.rst').format, 'restructuredtext')
         self.assertRaises(NotImplementedError, Parser, '.txt')
 
+    def test_split_rst_section_levels(self):
+        parser = Parser('.rst')
+        text = ('A\n====\n\n----\n\nA1\n----\n\n----\n\nB\n====\n\n'
+                '----\n\nB1\n----\n')
+        html = u''.join(parser.parse(part, True)
+                        for part in parser.split(text))
+        self.assertEqual(re.findall(r'<h(\d)>', html), ['1', '2', '1', '2'])
+        self.assertEqual(re.findall(r'<h(\d)>', parser.parse(text)),
+                         ['1', '2', '1', '2'])
+        self.assertFalse('landslide-section-level' in html)
+
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        source = os.path.join(source_dir, 'slides.rst')
+        with open(source, 'w') as slides:
+            slides.write(text)
+        g = Generator(source, cache=False, split_sources=True)
+        g.render()
+        self.assertEqual([(entry['level'], [sub['level']
+                                            for sub in entry['sub']])
+                          for entry in g.toc], [(1, [2]), (1, [2])])
+
 
 class WarningMessage(Exception):
     pass